@@ -0,0 +1,86 @@
+import os
+import pickle
+import threading
+from pathlib import Path
+
+from metrics import timed
+
+# Paths are resolved from the package location so the app works from any working directory
+APP_DIR = Path(__file__).resolve().parent
+ROOT_DIR = APP_DIR.parent
+RESOURCE_DIR = APP_DIR / "resource"
+
+MODEL_PATH = ROOT_DIR / "lead_qual_model.pkl"
+ENCODERS_PATH = ROOT_DIR / "label_encoders.pkl"
+REFERENCE_DATA_PATH = RESOURCE_DIR / "Lead Qualification Data.csv"
+EMAIL_DATA_PATH = RESOURCE_DIR / "email_data.csv"
+LOGO_PATH = RESOURCE_DIR / "Biware.png"
+KEYWORD_RULES_PATH = RESOURCE_DIR / "keyword_rules.json"
+
+_artifacts = {}
+_lock = threading.RLock()
+
+
+def load_artifact(path, loader):
+    """
+    Load an artifact once per process and keep it in memory.
+    The artifact is reloaded only when the file modification time changes.
+    """
+    mtime = os.path.getmtime(path)
+    key = (path, loader)
+    with _lock:
+        cached = _artifacts.get(key)
+        if cached is None or cached[0] != mtime:
+            with timed(f"load:{Path(path).name}"):
+                cached = (mtime, loader(path))
+            _artifacts[key] = cached
+    return cached[1]
+
+
+def _unpickle(path):
+    with open(path, 'rb') as f:
+        return pickle.load(f)
+
+
+def _joblib_load(path):
+    # joblib, and the libraries of the unpickled objects, are only imported when an artifact is loaded
+    import joblib
+
+    return joblib.load(path)
+
+
+def _read_reference_data(path):
+    from lead_store import read_csv_columnar
+
+    data = read_csv_columnar(path)
+    data.drop(columns=['Output'], inplace=True)
+    return data
+
+
+def _keyword_matcher(path):
+    from keyword_matcher import KeywordMatcher
+
+    return KeywordMatcher.from_file(path)
+
+
+def load_model():
+    return load_artifact(MODEL_PATH, _joblib_load)
+
+
+def load_encoders():
+    return load_artifact(ENCODERS_PATH, _unpickle)
+
+
+def load_keyword_matcher():
+    """
+    Seniority, job category and large company classifier compiled from the keyword rules file.
+    """
+    return load_artifact(KEYWORD_RULES_PATH, _keyword_matcher)
+
+
+def load_reference_data():
+    """
+    Historical leads used as reference for company frequencies, without the Output label.
+    The returned frame is shared, do not modify it in place.
+    """
+    return load_artifact(REFERENCE_DATA_PATH, _read_reference_data)
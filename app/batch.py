@@ -0,0 +1,218 @@
+"""
+Headless qualify-and-generate job, for cron workers.
+
+    python app/batch.py leads.csv --output results.jsonl --workers 8
+
+Results are appended to the JSONL output as soon as each email is generated, so the output
+doubles as a checkpoint: running the same command again skips qualification when the
+qualified leads file exists and only generates emails for rows not yet in the output.
+The input file and the options a checkpoint was made with are saved next to it, in
+<output>.run.json. A run with another input or other selection options refuses to reuse the
+checkpoint; --restart discards it and starts over.
+"""
+import argparse
+import json
+from pathlib import Path
+
+import pandas as pd
+
+from chains import Chain, EMAIL_INSTRUCTIONS, MAX_RETRIES, MAX_WORKERS, group_jobs
+from metrics import run_stats
+from scoring import CHUNK_SIZE, EMAIL_COLUMNS, SCORING_WORKERS, prioritize_csv_in_chunks, score_csv_in_chunks
+
+
+def qualify(input_path, qualified_path, chunksize=CHUNK_SIZE, max_leads=None, threshold=None, workers=SCORING_WORKERS):
+    def report(rows_done, total_rows, qualified):
+        print(f"Qualification: {rows_done}/{total_rows} leads scored, {qualified} qualified")
+
+    if max_leads or threshold is not None:
+        # Keep the best leads only, highest score first, so emails are generated for them first
+        rows, qualified = prioritize_csv_in_chunks(input_path, qualified_path, max_leads, threshold, chunksize, report, workers)
+    else:
+        rows, qualified = score_csv_in_chunks(input_path, qualified_path, chunksize, report, workers)
+    print(f"Qualified leads: {qualified}/{rows} saved to {qualified_path}")
+
+
+def read_results(output_path):
+    """
+    Yield the results saved in the JSONL output, skipping lines that cannot be decoded.
+    """
+    if not output_path.exists():
+        return
+    with open(output_path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                # Last line may be truncated if the previous run crashed while writing
+                continue
+
+
+def repair_checkpoint(output_path, block_size=65536):
+    """
+    Cut a line left truncated by a crash off the end of the JSONL output, so results
+    appended by the next run start on a line of their own.
+    """
+    if not output_path.exists():
+        return
+    with open(output_path, "rb+") as f:
+        end = f.seek(0, 2)
+        position = end
+        while position > 0:
+            start = max(0, position - block_size)
+            f.seek(start)
+            block = f.read(position - start)
+            newline = block.rfind(b"\n")
+            if newline >= 0:
+                position = start + newline + 1
+                break
+            position = start
+        if position < end:
+            print(f"Dropping a truncated result at the end of {output_path}")
+            f.truncate(position)
+
+
+def load_checkpoint(output_path):
+    """
+    Return the rows already generated successfully in a previous run.
+    """
+    return {result["row"] for result in read_results(output_path) if result.get("error") is None}
+
+
+def generate(chain, leads, email_type, output_path, max_workers=MAX_WORKERS, retries=MAX_RETRIES, group=False):
+    repair_checkpoint(output_path)
+    done = load_checkpoint(output_path)
+    rows = [row for row in range(len(leads)) if row not in done]
+    print(f"Generating {len(rows)} emails ({len(done)} already done)")
+    jobs = [{
+        "Contact": leads.at[row, "Name"],
+        "Job": leads.at[row, "Job"],
+        "Company": leads.at[row, "Company"],
+        "EmailType": email_type
+    } for row in rows]
+
+    failed = 0
+    with open(output_path, "a", encoding="utf-8") as f:
+        links = chain.portfolio_links(jobs)
+        write_mails = chain.write_mails
+        if group:
+            groups = len(group_jobs(jobs))
+            print(f"Grouping similar leads: {groups} emails to write, {len(jobs) - groups} LLM calls saved")
+            write_mails = chain.write_grouped_mails
+        for index, email, error in write_mails(jobs, links, max_workers=max_workers, retries=retries):
+            result = {
+                "row": rows[index],
+                "Name": jobs[index]["Contact"],
+                "Job": jobs[index]["Job"],
+                "Company": jobs[index]["Company"],
+                "EmailType": email_type,
+                "email": email,
+                "error": None if error is None else str(error)
+            }
+            f.write(json.dumps(result, ensure_ascii=False, default=str) + "\n")
+            f.flush()
+            if error is not None:
+                failed += 1
+                print(f"Row {rows[index]} failed: {error}")
+    print(f"Generated {len(rows) - failed} emails, {failed} failed")
+
+
+def export_csv(output_path, csv_path):
+    """
+    Write the last result of every row, in input order, to a CSV file.
+    """
+    results = pd.DataFrame(list(read_results(output_path)))
+    if not results.empty:
+        results = results.drop_duplicates("row", keep="last").sort_values("row")
+    results.to_csv(csv_path, index=False)
+    print(f"Results exported to {csv_path}")
+
+
+def run_fingerprint(args):
+    """
+    Identity of the input file and of the options selecting the leads and their emails.
+    """
+    stat = args.input.stat()
+    return {
+        "input": str(args.input.resolve()),
+        "size": stat.st_size,
+        "mtime": stat.st_mtime,
+        "skip_qualification": args.skip_qualification,
+        "max_emails": args.max_emails,
+        "min_score": args.min_score,
+        "email_type": args.email_type,
+    }
+
+
+def prepare_checkpoint(output_path, qualified_path, fingerprint, restart=False):
+    """
+    Make sure the checkpoint files of output_path belong to this run, and record its fingerprint.
+    Return an error message when they come from another input or other options, unless restart
+    is set, in which case they are deleted.
+    """
+    run_path = output_path.with_suffix(".run.json")
+    checkpoint = [path for path in (output_path, qualified_path) if path.exists()]
+    previous = json.loads(run_path.read_text(encoding="utf-8")) if run_path.exists() else None
+    if restart:
+        for path in checkpoint:
+            path.unlink()
+    elif checkpoint and previous != fingerprint:
+        origin = f"made from {previous['input']}" if previous else "of unknown origin"
+        return (f"{output_path} holds the results of another input or other options ({origin}). "
+                f"Use --restart to discard them, or another --output.")
+    run_path.write_text(json.dumps(fingerprint, indent=2), encoding="utf-8")
+    return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Qualify leads and generate emails without the Streamlit UI.")
+    parser.add_argument("input", type=Path, help="CSV file with the Contact, Fonction, Société, Secteur and Pays columns")
+    parser.add_argument("--output", type=Path, default=Path("results.jsonl"), help="JSONL results file, also used as checkpoint")
+    parser.add_argument("--csv", type=Path, help="Also export the results, in input order, to this CSV file")
+    parser.add_argument("--email-type", default="Email de Prospection", choices=list(EMAIL_INSTRUCTIONS))
+    parser.add_argument("--workers", type=int, default=MAX_WORKERS, help="Number of emails generated in parallel")
+    parser.add_argument("--retries", type=int, default=MAX_RETRIES, help="Retries per email before reporting an error")
+    parser.add_argument("--chunksize", type=int, default=CHUNK_SIZE, help="Number of leads scored at once")
+    parser.add_argument("--scoring-workers", type=int, default=SCORING_WORKERS, help="Number of processes scoring leads in parallel")
+    parser.add_argument("--skip-qualification", action="store_true", help="Generate emails for every lead of the input")
+    parser.add_argument("--max-emails", type=int, help="Generate emails for the best scored leads only, at most this many")
+    parser.add_argument("--min-score", type=float, help="Generate emails only for leads scoring at least this probability")
+    parser.add_argument("--group", action="store_true", help="Write one email per group of leads with the same job and company")
+    parser.add_argument("--stats", type=Path, help="Write the run statistics to this JSON file, and in Prometheus format next to it")
+    parser.add_argument("--restart", action="store_true", help="Discard the results and qualified leads of a previous run")
+    args = parser.parse_args(argv)
+
+    qualified_path = args.output.with_suffix(".qualified.csv")
+    error = prepare_checkpoint(args.output, qualified_path, run_fingerprint(args), args.restart)
+    if error is not None:
+        parser.error(error)
+
+    if args.skip_qualification:
+        leads = pd.read_csv(args.input).rename(columns=EMAIL_COLUMNS)
+    else:
+        if qualified_path.exists():
+            print(f"Resuming with the qualified leads of {qualified_path}")
+        else:
+            # Score into a temporary file so an interrupted qualification is not taken as done
+            partial_path = qualified_path.with_suffix(".partial.csv")
+            qualify(args.input, partial_path, args.chunksize, args.max_emails, args.min_score, args.scoring_workers)
+            partial_path.replace(qualified_path)
+        leads = pd.read_csv(qualified_path)
+
+    generate(Chain(), leads, args.email_type, args.output, args.workers, args.retries, args.group)
+    if args.csv:
+        export_csv(args.output, args.csv)
+
+    summary = run_stats.summary()
+    for stage, timing in summary["stages"].items():
+        print(f"{stage}: {timing['seconds']:.2f}s over {timing['calls']} calls")
+    print(f"LLM tokens: {summary['prompt_tokens']} prompt, {summary['completion_tokens']} completion, "
+          f"estimated cost {summary['estimated_cost_usd']:.4f} USD")
+    if args.stats:
+        args.stats.write_text(run_stats.to_json(), encoding="utf-8")
+        args.stats.with_suffix(".prom").write_text(run_stats.to_prometheus(), encoding="utf-8")
+        print(f"Run statistics saved to {args.stats}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+# Persistent caches live next to the repository, outside the app sources
+CACHE_DIR = Path(os.getenv("CACHE_DIR", Path(__file__).resolve().parent.parent / ".cache"))
+# Reading an entry refreshes its access time at most this often, in seconds, so that reads of
+# frequently used entries do not write to the database
+ACCESS_TIME_RESOLUTION = 60
+
+
+def make_key(*parts):
+    """
+    Build a content-addressed key from JSON-serializable parts.
+    """
+    payload = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class DiskCache:
+    """
+    Small persistent key/value cache backed by SQLite.
+    Values are stored as JSON. Entries older than ttl seconds are ignored and purged,
+    and the least recently used entries are evicted once max_entries is exceeded. Purging
+    runs when the cache is opened, then every max_entries / 100 writes, so the cache may briefly
+    exceed max_entries by 1%. Use get_cache to share one instance per cache in the process.
+    """
+
+    def __init__(self, name, ttl=None, max_entries=None, cache_dir=CACHE_DIR):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.path = Path(cache_dir) / f"{name}.sqlite3"
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        # Eviction deletes the oldest entries without scanning the whole table
+        self._conn.execute("CREATE INDEX IF NOT EXISTS cache_created_at ON cache (created_at)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS cache_accessed_at ON cache (accessed_at)")
+        self._evict_every = max(1, max_entries // 100) if max_entries else 100
+        self._writes = 0
+        # Writes of the previous instances may not have reached the eviction threshold
+        self._evict(time.time())
+        self._conn.commit()
+
+    def _expired(self, created_at, now):
+        return self.ttl is not None and now - created_at > self.ttl
+
+    def get(self, key, default=None):
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT value, created_at, accessed_at FROM cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return default
+            value, created_at, accessed_at = row
+            if self._expired(created_at, now):
+                self._conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+                self._conn.commit()
+                return default
+            if now - accessed_at > ACCESS_TIME_RESOLUTION:
+                self._conn.execute("UPDATE cache SET accessed_at = ? WHERE key = ?", (now, key))
+                self._conn.commit()
+        return json.loads(value)
+
+    def set(self, key, value):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO cache (key, value, created_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value, ensure_ascii=False), now, now)
+            )
+            self._writes += 1
+            if self._writes >= self._evict_every:
+                self._evict(now)
+                self._writes = 0
+            self._conn.commit()
+
+    def delete(self, key):
+        with self._lock:
+            self._conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+            self._conn.commit()
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM cache")
+            self._conn.commit()
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+
+    def _evict(self, now):
+        if self.ttl is not None:
+            self._conn.execute("DELETE FROM cache WHERE created_at < ?", (now - self.ttl,))
+        if self.max_entries is not None:
+            excess = self._conn.execute("SELECT COUNT(*) FROM cache").fetchone()[0] - self.max_entries
+            if excess > 0:
+                self._conn.execute(
+                    "DELETE FROM cache WHERE key IN (SELECT key FROM cache ORDER BY accessed_at LIMIT ?)", (excess,)
+                )
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def get_cache(name, ttl=None, max_entries=None, cache_dir=CACHE_DIR):
+    """
+    DiskCache shared by the whole process for each cache file, so that writes from every
+    session and every Chain count towards the same eviction schedule. The settings of the
+    first call for a cache apply.
+    """
+    path = Path(cache_dir) / f"{name}.sqlite3"
+    with _caches_lock:
+        if path not in _caches:
+            _caches[path] = DiskCache(name, ttl, max_entries, cache_dir)
+    return _caches[path]
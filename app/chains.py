@@ -1,36 +1,60 @@
+import logging
 import os
-from langchain_groq import ChatGroq
-from langchain_core.prompts import PromptTemplate
-from langchain_core.output_parsers import JsonOutputParser
-from langchain_core.exceptions import OutputParserException
-from langchain_community.document_loaders import WebBaseLoader
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import cached_property
 from dotenv import load_dotenv
+from cache import get_cache, make_key
+from metrics import run_stats, timed, with_run_stats
+from portfolio import get_portfolio
+from scheduler import get_scheduler, is_transient
+from utils import split_text
+
+# langchain, the Groq client, the scraper and pandas are imported on first use only,
+# so that the app starts fast whatever the mode
 
 load_dotenv()
+logger = logging.getLogger(__name__)
 
-class Chain:
-    def __init__(self):
-        self.llm = ChatGroq(temperature=0, groq_api_key=os.getenv("GROQ_API_KEY"), model_name="llama-3.1-70b-versatile")
+# Number of emails generated in parallel and retries per email for batch generation
+MAX_WORKERS = int(os.getenv("EMAIL_MAX_WORKERS", 4))
+MAX_RETRIES = int(os.getenv("EMAIL_MAX_RETRIES", 2))
+# Number of career pages scraped and extracted in parallel
+SCRAPE_MAX_WORKERS = int(os.getenv("SCRAPE_MAX_WORKERS", 4))
+# Large pages are split into chunks of at most EXTRACT_CHUNK_TOKENS tokens, extracted in parallel
+EXTRACT_CHUNK_TOKENS = int(os.getenv("EXTRACT_CHUNK_TOKENS", 3000))
+EXTRACT_MAX_WORKERS = int(os.getenv("EXTRACT_MAX_WORKERS", 4))
 
-    def scrape_website(self, url):
-        """
-        Scrape the given website URL and return the cleaned text.
-        """
-        try:
-            loader = WebBaseLoader([url])
-            page_content = loader.load().pop().page_content
-            return page_content.strip()
-        except Exception as e:
-            raise Exception(f"Failed to scrape the website: {e}")
+# Generated emails are cached on disk; bump PROMPT_VERSION whenever a prompt changes
+PROMPT_VERSION = 3
+EMAIL_CACHE_ENABLED = os.getenv("EMAIL_CACHE_DISABLED", "0") != "1"
+EMAIL_CACHE_TTL = int(os.getenv("EMAIL_CACHE_TTL", 30 * 24 * 3600))
+EMAIL_CACHE_MAX_ENTRIES = int(os.getenv("EMAIL_CACHE_MAX_ENTRIES", 50000))
 
-    def extract_jobs(self, cleaned_text):
-        """
-        Extract job postings from the scraped text in JSON format.
-        """
-        prompt_extract = PromptTemplate.from_template(
-            f"""
+# Instruction given to the LLM for each email type
+EMAIL_INSTRUCTIONS = {
+    "Email de Prospection": "Write a professional cold email introducing Biware.",
+    "Email de Relance": "Write a follow-up email referencing a previous communication.",
+    "Remerciement": "Write a thank you email for the client's time.",
+    "Proposition": "Write an email presenting Biware's detailed proposal.",
+    "Proposition de formation": "Write an email where biware proposes a training service",
+}
+DEFAULT_INSTRUCTION = "Write a general professional email."
+# Added to the email prompts when relevant portfolio links were found
+PORTFOLIO_INSTRUCTION = "Also add the most relevant ones from the following links to showcase Biware's portfolio: {links}"
+PORTFOLIO_ENABLED = os.getenv("PORTFOLIO_DISABLED", "0") != "1"
+# Contact name of an email written once for a group of similar leads, replaced for each lead afterwards
+CONTACT_PLACEHOLDER = "[[CONTACT]]"
+DEFAULT_CONTACT = "Madame, Monsieur"
+CONTACT_INSTRUCTION = (
+    f"Address the contact as {CONTACT_PLACEHOLDER}, written exactly like this, in the greeting: "
+    "it is replaced with the contact name afterwards."
+)
+
+PROMPT_EXTRACT = """
             ### SCRAPED TEXT FROM WEBSITE:
-            {cleaned_text}
+            {page_data}
             ### INSTRUCTION:
             The scraped text is from the career's page of a website.
             Your job is to extract the job postings and return them in JSON format containing the following keys: 
@@ -39,52 +63,10 @@ class Chain:
             If `contact_job_title` is missing, infer it from the context of the job posting.
             ### VALID JSON (NO PREAMBLE):
             """
-        )
-        chain_extract = prompt_extract | self.llm
-        res = chain_extract.invoke(input={"page_data": cleaned_text})
-        try:
-            json_parser = JsonOutputParser()
-            res = json_parser.parse(res.content)
-        except OutputParserException:
-            raise OutputParserException("Context too big. Unable to parse jobs.")
-        return res if isinstance(res, list) else [res]
 
-
-    def display_job_description(self, job):
-        """
-        Display the job details in a clear, formatted style.
-        """
-        print("\n================= Job Details =================")
-        print(f"Role: {job.get('role', 'Not Provided')}")
-        print(f"Company: {job.get('company', 'Not Provided')}")
-        print(f"Contact Person: {job.get('contact_name', 'Responsible Hiring Manager')} ({job.get('contact_job_title', 'Not Provided')})")
-        print(f"Experience Required: {job.get('experience', 'Not Provided')}")
-        print(f"Key Skills: {', '.join(job.get('skills', [])) if job.get('skills') else 'Not Provided'}")
-        print("\nJob Description:")
-        print(job.get('description', 'Not Provided'))
-        print("================================================\n")
-
-    def write_mail(self, job):
-        email_type = job.get("EmailType", "Cold Outreach")
-
-        if email_type == "Email de Prospection":
-            instruction = "Write a professional cold email introducing Biware."
-        elif email_type == "Email de Relance":
-            instruction = "Write a follow-up email referencing a previous communication."
-        elif email_type == "Remerciement":
-            instruction = "Write a thank you email for the client's time."
-        elif email_type == "Proposition":
-            instruction = "Write an email presenting Biware's detailed proposal."
-        elif email_type == "Proposition de formation":
-            instruction = "Write an email where biware proposes a training service"
-
-        else:
-            instruction = "Write a general professional email."
-
-        prompt_email = PromptTemplate.from_template(
-            f"""
+PROMPT_EMAIL = """
             ### JOB DESCRIPTION:
-            {{job_description}}
+            {job_description}
 
             ### INSTRUCTION:
             You are Biware Worker Example, a business development executive at Biware.
@@ -94,6 +76,8 @@ class Chain:
             Biware delivers Customer Intelligence, Risk Management, Fraud and Compliance, Demand Forecasting, and Model Analytics Solutions 
             to Large Businesses for Finance, Telecommunication, Retail & Energy/Utilities companies using the most advanced analytics software.
             Your job is to {instruction}.
+            {link_list}
+            {contact_instruction}
 
             The email has to be in French.
             Do not create fictional emails adresses to insert at the end.
@@ -101,32 +85,10 @@ class Chain:
             ### EMAIL (NO PREAMBLE):
 
             """
-        )
-        chain_email = prompt_email | self.llm
-        res = chain_email.invoke({"job_description": str(job)})
-        return res.content
 
-    def write_mail_url(self, job, links=None,email_type="Email de Prospection"):
-
-        if email_type == "Email de Prospection":
-            instruction = "Write a professional cold email introducing Biware."
-        elif email_type == "Email de Relance":
-            instruction = "Write a follow-up email referencing a previous communication."
-        elif email_type == "Remerciement":
-            instruction = "Write a thank you email for the client's time."
-        elif email_type == "Proposition":
-            instruction = "Write an email presenting Biware's detailed proposal."
-        elif email_type == "Proposition de formation":
-            instruction = "Write an email where biware proposes a training service"
-
-        else:
-            instruction = "Write a general professional email."
-
-        links = links or []
-        prompt_email = PromptTemplate.from_template(
-            f"""
+PROMPT_EMAIL_URL = """
             ### JOB DESCRIPTION:
-            {{job_description}}
+            {job_description}
 
             ### INSTRUCTION:
             You are Biware Worker Example, a business development executive at Biware.
@@ -137,31 +99,426 @@ class Chain:
             to Large Businesses for Finance, Telecommunication, Retail & Energy/Utilities companies using the most advanced analytics software.
             Make sure you utilize the description of the job provided to emphasis on how Biware can help with this job.
             Your job is to {instruction}.   
+            {link_list}
+            {contact_instruction}
             The email must be in French. 
             Do not create fictional email addresses at the end.
             Do not provide a preamble.
             ### EMAIL (NO PREAMBLE):
             """
+
+EMAIL_PROMPTS = {"email": PROMPT_EMAIL, "email_url": PROMPT_EMAIL_URL}
+
+
+def _job_key(job):
+    return tuple(" ".join(str(job.get(field) or "").split()).casefold() for field in ("role", "company"))
+
+
+def group_jobs(jobs):
+    """
+    Group the indexes of jobs sharing the same normalized job title, company and email type,
+    which get the same email apart from the contact name. Groups keep the order of the jobs.
+    """
+    from lead_qual import simplify_company_name, simplify_job_title
+
+    groups = {}
+    for index, job in enumerate(jobs):
+        job_title, company = (job.get(field) for field in ("Job", "Company"))
+        key = (
+            simplify_job_title(str(job_title)) if job_title == job_title and job_title is not None else None,
+            simplify_company_name(str(company)) if company == company and company is not None else None,
+            job.get("EmailType"),
+        )
+        groups.setdefault(key, []).append(index)
+    return list(groups.values())
+
+
+def personalize(email, contact):
+    name = DEFAULT_CONTACT if contact is None or contact != contact or not str(contact).strip() else str(contact).strip()
+    return email.replace(CONTACT_PLACEHOLDER, name)
+
+
+def merge_jobs(jobs):
+    """
+    Deduplicate jobs extracted from several chunks by (role, company), in order of appearance.
+    Fields missing from the first occurrence are completed from the duplicates.
+    """
+    merged = {}
+    for job in jobs:
+        if not isinstance(job, dict) or not job:
+            continue
+        key = _job_key(job)
+        if key not in merged:
+            merged[key] = dict(job)
+            continue
+        for field, value in job.items():
+            if value and not merged[key].get(field):
+                merged[key][field] = value
+    return list(merged.values())
+
+
+class Chain:
+    """
+    The LLM client, prompt chains and scraping session are created on first use.
+    llm replaces the Groq model, e.g. with a fake model for offline runs.
+    Calls go through the scheduler of the process unless another scheduler is given.
+    """
+
+    def __init__(self, use_cache=EMAIL_CACHE_ENABLED, llm=None, scheduler=None):
+        if llm is not None:
+            self.llm = llm
+        self.scheduler = get_scheduler() if scheduler is None else scheduler
+        # When use_cache is False cached emails are bypassed, but fresh ones still refresh the cache
+        self.use_cache = use_cache
+        self.email_cache = get_cache("emails", ttl=EMAIL_CACHE_TTL, max_entries=EMAIL_CACHE_MAX_ENTRIES)
+        self.page_stats = {}
+        # Error of the last portfolio retrieval, so that the UI can report it
+        self.portfolio_error = None
+
+    @cached_property
+    def llm(self):
+        from langchain_groq import ChatGroq
+
+        # Retries are left to the scheduler, which also keeps the calls within the provider rate limits
+        return ChatGroq(temperature=0, groq_api_key=os.getenv("GROQ_API_KEY"), model_name="llama-3.1-70b-versatile", max_retries=0)
+
+    @cached_property
+    def fetcher(self):
+        from scraper import PageFetcher, SCRAPE_CACHE_MAX_ENTRIES, SCRAPE_CACHE_TTL
+
+        return PageFetcher(cache=get_cache("pages", ttl=SCRAPE_CACHE_TTL, max_entries=SCRAPE_CACHE_MAX_ENTRIES))
+
+    @cached_property
+    def jobs_cache(self):
+        from scraper import SCRAPE_CACHE_MAX_ENTRIES, SCRAPE_CACHE_TTL
+
+        # Jobs extracted from a page, keyed by the hash of its cleaned text
+        return get_cache("jobs", ttl=SCRAPE_CACHE_TTL, max_entries=SCRAPE_CACHE_MAX_ENTRIES)
+
+    # Prompts are parsed and chained to the LLM once, then reused for every call
+
+    @cached_property
+    def chain_extract(self):
+        from langchain_core.prompts import PromptTemplate
+
+        return PromptTemplate.from_template(PROMPT_EXTRACT) | self.llm
+
+    @cached_property
+    def email_chains(self):
+        return {
+            (kind, email_type): self._build_email_chain(template, instruction)
+            for kind, template in EMAIL_PROMPTS.items()
+            for email_type, instruction in [*EMAIL_INSTRUCTIONS.items(), (None, DEFAULT_INSTRUCTION)]
+        }
+
+    @cached_property
+    def json_parser(self):
+        from langchain_core.output_parsers import JsonOutputParser
+
+        return JsonOutputParser()
+
+    def _build_email_chain(self, template, instruction):
+        from langchain_core.prompts import PromptTemplate
+
+        prompt = PromptTemplate.from_template(template, partial_variables={"instruction": instruction})
+        return prompt | self.llm
+
+    def _email_chain(self, kind, email_type):
+        """
+        Return the prebuilt chain for the given prompt kind and email type.
+        Unknown email types fall back to the general professional email instruction.
+        """
+        if email_type not in EMAIL_INSTRUCTIONS:
+            email_type = None
+        return self.email_chains[(kind, email_type)]
+
+    def _email_cache_key(self, kind, job, email_type, links=None):
+        normalized_job = {
+            str(key): None if value is None or value != value else " ".join(str(value).split())
+            for key, value in job.items()
+        }
+        return make_key(kind, normalized_job, email_type, links or [], PROMPT_VERSION, self.llm.model_name)
+
+    def portfolio_links(self, jobs):
+        """
+        Relevant portfolio links for each job, retrieved from the vectorstore in a single batch.
+        Emails are still generated, without links, when the vectorstore or the embedding model
+        is unavailable; the error is logged and kept in portfolio_error.
+        """
+        self.portfolio_error = None
+        if not PORTFOLIO_ENABLED or not jobs:
+            return [[] for _ in jobs]
+        try:
+            return get_portfolio().query_links(jobs)
+        except Exception as e:
+            logger.warning("Portfolio retrieval failed, emails are written without links: %s", e, exc_info=True)
+            run_stats.increment("portfolio_failures")
+            self.portfolio_error = e
+            return [[] for _ in jobs]
+
+    def _link_list(self, links):
+        return PORTFOLIO_INSTRUCTION.format(links=", ".join(links)) if links else ""
+
+    def _email_request(self, kind, job, email_type, links=None):
+        chain_email = self._email_chain(kind, email_type)
+        key = self._email_cache_key(kind, job, email_type, links)
+        contact_instruction = CONTACT_INSTRUCTION if job.get("Contact") == CONTACT_PLACEHOLDER else ""
+        return key, chain_email, {
+            "job_description": str(job), "link_list": self._link_list(links), "contact_instruction": contact_instruction
+        }
+
+    def _cached_email(self, key, chain_email, inputs):
+        if self.use_cache:
+            email = self.email_cache.get(key)
+            if email is not None:
+                run_stats.increment("email_cache_hits")
+                return email
+        with timed("write_mail"):
+            res = self.scheduler.invoke(chain_email, inputs)
+        run_stats.add_usage("write_mail", res)
+        email = res.content
+        self.email_cache.set(key, email)
+        return email
+
+    def _stream_cached_email(self, key, chain_email, inputs, metrics=None):
+        """
+        Yield the email chunk by chunk as the LLM produces it, or at once when it is cached.
+        metrics is filled with time_to_first_token and latency, in seconds, and cached.
+        """
+        metrics = {} if metrics is None else metrics
+        start = time.perf_counter()
+        email = self.email_cache.get(key) if self.use_cache else None
+        metrics["cached"] = email is not None
+        if email is not None:
+            run_stats.increment("email_cache_hits")
+            metrics["time_to_first_token"] = metrics["latency"] = time.perf_counter() - start
+            yield email
+            return
+        message = None
+        for chunk in self.scheduler.stream(chain_email, inputs):
+            if message is None:
+                metrics["time_to_first_token"] = time.perf_counter() - start
+                run_stats.record("time_to_first_token", metrics["time_to_first_token"])
+            message = chunk if message is None else message + chunk
+            yield chunk.content
+        metrics["latency"] = time.perf_counter() - start
+        run_stats.record("write_mail", metrics["latency"])
+        if message is not None:
+            run_stats.add_usage("write_mail", message)
+            self.email_cache.set(key, message.content)
+
+    @timed("scrape_website")
+    def _scrape_page(self, url, force_refresh=False):
+        try:
+            page = self.fetcher.fetch_page(url, force_refresh)
+        except Exception as e:
+            raise Exception(f"Failed to scrape the website: {e}")
+        # Token reduction of the preprocessing, per page
+        self.page_stats[url] = {"raw_tokens": page["raw_tokens"], "clean_tokens": page["clean_tokens"]}
+        return page
+
+    def scrape_website(self, url, force_refresh=False):
+        """
+        Scrape the given website URL and return the cleaned text.
+        """
+        return self._scrape_page(url, force_refresh)["text"]
+
+    def scrape_jobs(self, url, force_refresh=False):
+        """
+        Scrape a career page and extract its jobs. When the cleaned text of the page did not
+        change since a previous extraction, the stored jobs are returned without calling the LLM.
+        """
+        page = self._scrape_page(url, force_refresh)
+        key = make_key("jobs", page["text_hash"], PROMPT_VERSION, self.llm.model_name)
+        jobs = None if force_refresh else self.jobs_cache.get(key)
+        if jobs is not None:
+            run_stats.increment("jobs_cache_hits")
+        else:
+            jobs = self.extract_jobs(page["text"])
+            self.jobs_cache.set(key, jobs)
+        return jobs
+
+    def crawl(self, urls, max_workers=SCRAPE_MAX_WORKERS, force_refresh=False):
+        """
+        Scrape several career pages and extract their jobs concurrently.
+        Yields (url, jobs, error) tuples as soon as each page is done.
+        """
+        executor = ThreadPoolExecutor(max_workers=max(1, max_workers))
+        try:
+            # Worker threads record into the run statistics of the caller, e.g. of its Streamlit session
+            scrape_jobs = with_run_stats(self.scrape_jobs)
+            futures = {executor.submit(scrape_jobs, url, force_refresh): url for url in urls}
+            for future in as_completed(futures):
+                try:
+                    yield futures[future], future.result(), None
+                except Exception as e:
+                    yield futures[future], None, e
+        finally:
+            # A consumer stopping early, e.g. a Streamlit rerun, must not wait for the pages still queued
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def _extract_chunk(self, text):
+        from langchain_core.exceptions import OutputParserException
+
+        res = self.scheduler.invoke(self.chain_extract, {"page_data": text})
+        run_stats.add_usage("extract_jobs", res)
+        try:
+            res = self.json_parser.parse(res.content)
+        except OutputParserException:
+            raise OutputParserException("Context too big. Unable to parse jobs.")
+        return res if isinstance(res, list) else [res]
+
+    @timed("extract_jobs")
+    def extract_jobs(self, cleaned_text):
+        """
+        Extract job postings from the scraped text in JSON format.
+        Text over the token budget is split at job boundaries and the chunks are extracted
+        concurrently. Chunks that fail are skipped as long as one of them succeeds.
+        """
+        chunks = split_text(cleaned_text, EXTRACT_CHUNK_TOKENS)
+        if len(chunks) == 1:
+            return self._extract_chunk(chunks[0])
+
+        jobs = []
+        errors = []
+        executor = ThreadPoolExecutor(max_workers=min(EXTRACT_MAX_WORKERS, len(chunks)))
+        try:
+            extract_chunk = with_run_stats(self._extract_chunk)
+            futures = [executor.submit(extract_chunk, chunk) for chunk in chunks]
+            for future in futures:
+                try:
+                    jobs.extend(future.result())
+                except Exception as e:
+                    errors.append(e)
+        finally:
+            # Chunks not started yet are dropped when the extraction is interrupted
+            executor.shutdown(wait=False, cancel_futures=True)
+        if len(errors) == len(chunks):
+            raise errors[0]
+        return merge_jobs(jobs)
+
+
+    def display_job_description(self, job):
+        """
+        Display the job details in a clear, formatted style.
+        """
+        print("\n================= Job Details =================")
+        print(f"Role: {job.get('role', 'Not Provided')}")
+        print(f"Company: {job.get('company', 'Not Provided')}")
+        print(f"Contact Person: {job.get('contact_name', 'Responsible Hiring Manager')} ({job.get('contact_job_title', 'Not Provided')})")
+        print(f"Experience Required: {job.get('experience', 'Not Provided')}")
+        print(f"Key Skills: {', '.join(job.get('skills', [])) if job.get('skills') else 'Not Provided'}")
+        print("\nJob Description:")
+        print(job.get('description', 'Not Provided'))
+        print("================================================\n")
+
+    def write_mail(self, job, links=None):
+        email_type = job.get("EmailType", "Cold Outreach")
+        return self._cached_email(*self._email_request("email", job, email_type, links))
+
+    def stream_mail(self, job, links=None, metrics=None):
+        """
+        Same email as write_mail, streamed chunk by chunk. See _stream_cached_email for metrics.
+        """
+        email_type = job.get("EmailType", "Cold Outreach")
+        return self._stream_cached_email(*self._email_request("email", job, email_type, links), metrics)
+
+    def write_mail_url(self, job, links=None,email_type="Email de Prospection"):
+        return self._cached_email(*self._email_request("email_url", job, email_type, links))
+
+    def stream_mail_url(self, job, links=None, email_type="Email de Prospection", metrics=None):
+        return self._stream_cached_email(*self._email_request("email_url", job, email_type, links), metrics)
+
+    def _write_mail_with_retries(self, job, links, retries):
+        for attempt in range(retries + 1):
+            try:
+                return self.write_mail(job, links)
+            except Exception as e:
+                # Transient errors were already retried with backoff by the scheduler
+                if attempt == retries or is_transient(e):
+                    raise
+                time.sleep(attempt + 1)
+
+    def write_mails(self, jobs, links=None, max_workers=MAX_WORKERS, retries=MAX_RETRIES):
+        """
+        Generate emails for several jobs concurrently, with the portfolio links of each job if given.
+        Yields (index, email, error) tuples as soon as each email is ready, where index is
+        the position of the job in the input list. A failing job is retried on its own and
+        reported through error without stopping the rest of the batch.
+        """
+        executor = ThreadPoolExecutor(max_workers=max(1, max_workers))
+        try:
+            write_mail = with_run_stats(self._write_mail_with_retries)
+            futures = {
+                executor.submit(write_mail, job, links[index] if links else None, retries): index
+                for index, job in enumerate(jobs)
+            }
+            for future in as_completed(futures):
+                index = futures[future]
+                try:
+                    yield index, future.result(), None
+                except Exception as e:
+                    yield index, None, e
+        finally:
+            # When the consumer stops early (Streamlit rerun, interrupted job), the queued emails
+            # are cancelled instead of being generated, and paid for, before the generator closes
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def write_grouped_mails(self, jobs, links=None, max_workers=MAX_WORKERS, retries=MAX_RETRIES):
+        """
+        Same as write_mails, but similar jobs (see group_jobs) share one generated email,
+        written for a placeholder contact then personalized with the contact name of each job.
+        When the LLM left out the placeholder, the jobs of the group get their own email instead.
+        """
+        groups = group_jobs(jobs)
+        run_stats.increment("llm_calls_saved", len(jobs) - len(groups))
+        templates = [{**jobs[group[0]], "Contact": CONTACT_PLACEHOLDER} for group in groups]
+        template_links = [links[group[0]] for group in groups] if links else None
+        fallback = []
+        results = self.write_mails(templates, template_links, max_workers, retries)
+        try:
+            for group_index, email, error in results:
+                if error is None and CONTACT_PLACEHOLDER not in email:
+                    fallback.extend(groups[group_index])
+                    continue
+                for index in groups[group_index]:
+                    yield index, None if error is not None else personalize(email, jobs[index]["Contact"]), error
+        finally:
+            results.close()
+        if not fallback:
+            return
+
+        run_stats.increment("llm_calls_saved", -len(fallback))
+        run_stats.increment("grouped_email_fallbacks", len(fallback))
+        results = self.write_mails(
+            [jobs[index] for index in fallback], [links[index] for index in fallback] if links else None, max_workers, retries
         )
-        chain_email = prompt_email | self.llm
-        res = chain_email.invoke({"job_description": str(job), "link_list": ", ".join(links)})
-        return res.content
+        try:
+            for fallback_index, email, error in results:
+                yield fallback[fallback_index], email, error
+        finally:
+            results.close()
 
 if __name__ == "__main__":
     chain = Chain()
-    url = input("Enter the job posting URL: ")
-    try:
-        print("Scraping the website...")
-        scraped_text = chain.scrape_website(url)
-        jobs = chain.extract_jobs(scraped_text)
-        for idx, job in enumerate(jobs):
-            print(f"\nJob #{idx + 1}:\n")
-            chain.display_job_description(job)
-            generate_email = input("Generate an email for this job? (yes/no): ").strip().lower()
-            if generate_email == "yes":
-                email = chain.write_mail(job)
-                print("\nGenerated Email:")
-                print(email)
-                print("\n================================================\n")
-    except Exception as e:
-        print(f"An error occurred: {e}")
+    urls = sys.argv[1:] or input("Enter the job posting URLs (separated by spaces): ").split()
+    print("Scraping the websites...")
+    for url, jobs, error in chain.crawl(urls):
+        if error is not None:
+            print(f"An error occurred with {url}: {error}")
+            continue
+        stats = chain.page_stats.get(url)
+        if stats:
+            print(f"{url}: {stats['raw_tokens']} tokens reduced to {stats['clean_tokens']} after cleaning")
+        try:
+            for idx, job in enumerate(jobs):
+                print(f"\nJob #{idx + 1} from {url}:\n")
+                chain.display_job_description(job)
+                generate_email = input("Generate an email for this job? (yes/no): ").strip().lower()
+                if generate_email == "yes":
+                    email = chain.write_mail(job)
+                    print("\nGenerated Email:")
+                    print(email)
+                    print("\n================================================\n")
+        except Exception as e:
+            print(f"An error occurred: {e}")
@@ -0,0 +1,70 @@
+import os
+import uuid
+
+import joblib
+
+from artifacts import REFERENCE_DATA_PATH, load_artifact, load_reference_data
+from cache import CACHE_DIR
+from lead_qual import feature_engineering
+
+FEATURE_STORE_PATH = CACHE_DIR / "feature_store.joblib"
+
+
+class FeatureStore:
+    """
+    Precomputed state of the historical leads needed to score new leads on their own:
+    their columns and the raw `Société` counts used for Company_Frequency.
+    """
+
+    def __init__(self, source_mtime, columns, company_counts):
+        self.source_mtime = source_mtime
+        self.columns = columns
+        self.company_counts = company_counts
+
+    @classmethod
+    def build(cls, reference_data, source_mtime=None):
+        # Counted as plain strings, the reference leads may be categorical
+        company_counts = reference_data["Société"].astype(object).value_counts()
+        return cls(source_mtime, list(reference_data.columns), company_counts)
+
+    def company_frequencies(self, companies):
+        """
+        Company counts over the historical leads plus the given companies,
+        as if both tables were concatenated.
+        """
+        return self.company_counts.add(companies.value_counts(), fill_value=0).astype('int64')
+
+    def engineer(self, leads, company_counts=None):
+        """
+        Engineer features for new leads only. Company frequencies default to the
+        historical counts plus the counts of the new leads.
+        """
+        if company_counts is None:
+            company_counts = self.company_frequencies(leads["Société"])
+        return feature_engineering(leads[self.columns].copy(), company_counts)
+
+    def save(self, path=FEATURE_STORE_PATH):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # Write then rename, so the app, the batch job, the scoring service and the scoring
+        # workers loading the store at the same time never read a partial file
+        partial_path = path.with_name(f".{path.name}.{uuid.uuid4().hex}")
+        joblib.dump(self, partial_path)
+        os.replace(partial_path, path)
+
+
+def _load_or_build(reference_path):
+    source_mtime = os.path.getmtime(reference_path)
+    if FEATURE_STORE_PATH.exists():
+        store = joblib.load(FEATURE_STORE_PATH)
+        if store.source_mtime == source_mtime:
+            return store
+    store = FeatureStore.build(load_reference_data(), source_mtime)
+    store.save()
+    return store
+
+
+def load_feature_store():
+    """
+    Feature store of the reference dataset, persisted on disk and rebuilt when the reference CSV changes.
+    """
+    return load_artifact(REFERENCE_DATA_PATH, _load_or_build)
@@ -0,0 +1,124 @@
+import json
+from collections import deque
+
+import numpy as np
+
+# Characters, padding included, scanned at once. Texts are sorted by length and cut into blocks of
+# about this many characters, so each block is padded to the length of texts of about the same
+# size, and a very long cell is scanned in a block of its own
+SCAN_BLOCK_CHARS = 2 ** 20
+
+
+class KeywordMatcher:
+    """
+    Keyword classifier for several features at once, built from rules such as keyword_rules.json:
+    {feature: {"default": label, "rules": [{"label": label, "keywords": [...]}, ...]}}.
+    Each feature of a text gets the label of its first rule with a keyword contained in the text,
+    or its default label. All keywords are compiled into one Aho-Corasick automaton, so a text is
+    scanned in a single pass whatever the number of keywords, and that pass gives the labels of
+    every feature. Callers whose features read different texts scan each of them.
+    """
+
+    def __init__(self, rules):
+        self.features = list(rules)
+        # Label of every rule of each feature, followed by the default label for no match
+        self._labels = [
+            np.array([rule["label"] for rule in rules[feature]["rules"]] + [rules[feature]["default"]], dtype=object)
+            for feature in self.features
+        ]
+        no_match = [len(labels) - 1 for labels in self._labels]
+
+        # Trie of the keywords, each state keeps the first rule of each feature ending there
+        edges = [{}]
+        first_rule = [list(no_match)]
+        for index, feature in enumerate(self.features):
+            for rule_index, rule in enumerate(rules[feature]["rules"]):
+                for keyword in rule["keywords"]:
+                    state = 0
+                    for char in keyword:
+                        if char not in edges[state]:
+                            edges[state][char] = len(edges)
+                            edges.append({})
+                            first_rule.append(list(no_match))
+                        state = edges[state][char]
+                    first_rule[state][index] = min(first_rule[state][index], rule_index)
+
+        # Characters absent from every keyword share code 0, which leads back to the root
+        alphabet = sorted({char for state_edges in edges for char in state_edges})
+        self._char_codes = np.zeros(ord(alphabet[-1]) + 1 if alphabet else 1, dtype=np.int32)
+        for code, char in enumerate(alphabet, 1):
+            self._char_codes[ord(char)] = code
+
+        # Breadth first, complete the trie into a transition table following the failure links,
+        # and let each state also match the keywords ending at its longest proper suffix
+        self._transitions = np.zeros((len(edges), len(alphabet) + 1), dtype=np.int32)
+        self._first_rule = np.array(first_rule, dtype=np.int32).reshape(len(edges), len(self.features))
+        failure = [0] * len(edges)
+        queue = deque()
+        for char, child in edges[0].items():
+            self._transitions[0, self._char_codes[ord(char)]] = child
+            queue.append(child)
+        while queue:
+            state = queue.popleft()
+            self._transitions[state] = self._transitions[failure[state]]
+            np.minimum(self._first_rule[state], self._first_rule[failure[state]], out=self._first_rule[state])
+            for char, child in edges[state].items():
+                code = self._char_codes[ord(char)]
+                failure[child] = self._transitions[failure[state], code]
+                self._transitions[state, code] = child
+                queue.append(child)
+
+    @classmethod
+    def from_file(cls, path):
+        with open(path, encoding="utf-8") as f:
+            return cls(json.load(f))
+
+    def _scan_block(self, texts):
+        first_rule = np.tile(self._first_rule[0], (len(texts), 1))
+        width = max(map(len, texts), default=0)
+        if not width:
+            return first_rule
+        # One row of code points per text, padded with code point 0
+        chars = np.array(texts, dtype=f"<U{width}").view(np.uint32).reshape(len(texts), width)
+        codes = self._char_codes[np.minimum(chars, len(self._char_codes) - 1)]
+        codes[chars >= len(self._char_codes)] = 0
+        states = np.zeros(len(texts), dtype=np.int32)
+        for column in codes.T:
+            states = self._transitions[states, column]
+            np.minimum(first_rule, self._first_rule[states], out=first_rule)
+        return first_rule
+
+    def scan(self, texts):
+        """
+        Index of the first matching rule of each feature (columns) for each text (rows),
+        the number of rules of the feature when none matches.
+        """
+        texts = [str(text) for text in texts]
+        first_rule = np.empty((len(texts), len(self.features)), dtype=np.int32)
+        block = []
+        for index in np.argsort([len(text) for text in texts], kind="stable"):
+            # Sorted by length, the last text added sets the padded width of the block
+            if block and (len(block) + 1) * len(texts[index]) > SCAN_BLOCK_CHARS:
+                first_rule[block] = self._scan_block([texts[i] for i in block])
+                block = []
+            block.append(index)
+        if block:
+            first_rule[block] = self._scan_block([texts[i] for i in block])
+        return first_rule
+
+    def classify_many(self, texts, features=None):
+        """
+        Labels of the given features, every feature by default, for each text, as {feature: array of labels}.
+        """
+        first_rule = self.scan(texts)
+        return {
+            feature: labels[first_rule[:, index]]
+            for index, (feature, labels) in enumerate(zip(self.features, self._labels))
+            if features is None or feature in features
+        }
+
+    def classify(self, text):
+        """
+        Labels of every feature for one text, as {feature: label}.
+        """
+        return {feature: labels[0] for feature, labels in self.classify_many([text]).items()}
@@ -1,39 +1,55 @@
+import numpy as np
 import pandas as pd
-from sklearn.preprocessing import LabelEncoder
 import re
-import pickle
+from functools import lru_cache
+from artifacts import load_encoders, load_keyword_matcher
+from metrics import timed
+
+
+COMMON_COMPANY_WORDS = ['group', 'inc', 'company', 'corporation', 'ltd', 'limited', 'sarl', 'spa', 'sa']
+
+
+NON_ALPHANUMERIC_RE = re.compile(r'[^a-z0-9\s]')
+COMMON_COMPANY_WORDS_RE = re.compile(r'\b(?:' + '|'.join(COMMON_COMPANY_WORDS) + r')\b')
+SPACES_RE = re.compile(r'\s+')
+
+
+def map_unique(series, func):
+    """
+    Apply a vectorized function to the distinct values of a series only and broadcast
+    the result back, since lead exports repeat the same titles and companies a lot.
+    """
+    codes, uniques = pd.factorize(series, use_na_sentinel=False)
+    result = np.asarray(func(pd.Series(uniques, dtype=object)), dtype=object)
+    return pd.Series(result[codes], index=series.index)
+
+
+def normalize_text_series(series, remove_words=None):
+    """
+    Vectorized lowercasing and cleanup of names, keeping missing values as they are.
+    """
+    series = series.astype(object).str.lower().str.replace(NON_ALPHANUMERIC_RE, '', regex=True)
+    if remove_words is not None:
+        series = series.str.replace(remove_words, '', regex=True)
+    return series.str.replace(SPACES_RE, ' ', regex=True).str.strip()
 
 
 # Feature engineering
 
 
+# Seniority, job category and large company keywords are rules of resource/keyword_rules.json.
+# Each feature reads its own text (raw title, simplified title, simplified company), so the
+# distinct values of each are scanned once and only the label of that feature is kept
+
+
 def extract_seniority(fonction):
-    fonction = str(fonction).lower()
-    senior_keywords = [
-        "directeur", "directrice", "chef", "responsable", "manager", "head",
-        "lead", "c-level", "ceo", "cfo", "cio", "cto", "president", "coo",
-        "dga", "dg", "administrateur", "chief", "directeur général"
-    ]
-    mid_keywords = [
-        "spécialiste", "specialist", "ingénieur", "consultant", "analyst",
-        "supervisor", "coordinateur", "coordinator", "project manager",
-        "chargé", "chargée", "développeur", "developer", "senior analyst"
-    ]
-    junior_keywords = [
-        "stagiaire", "junior", "trainee", "intern", "assistant", "associate"
-    ]
-    if any(keyword in fonction for keyword in senior_keywords):
-        return "senior"
-    elif any(keyword in fonction for keyword in mid_keywords):
-        return "mid"
-    elif any(keyword in fonction for keyword in junior_keywords):
-        return "junior"
-    else:
-        return "unknown"
+    return load_keyword_matcher().classify(str(fonction).lower())["seniority"]
 
 
 def apply_extract_seniority(data):
-    data['Seniority'] = data["Fonction"].apply(extract_seniority)
+    data['Seniority'] = map_unique(
+        data["Fonction"], lambda fonction: load_keyword_matcher().classify_many(fonction.astype(str).str.lower(), ["seniority"])["seniority"]
+    )
     return data
 
 
@@ -79,7 +95,8 @@ def simplify_sector(data):
         'Other - Unsegmented': 'Other',
         'unknown': 'Other'
     }
-    data["Simplified_Sector"] = data["Secteur"].map(sector_mapping).fillna('Other')
+    # Categorical columns map to categoricals, which only accept their own categories as fill value
+    data["Simplified_Sector"] = data["Secteur"].map(sector_mapping).astype(object).fillna('Other')
     return data
 
 
@@ -125,13 +142,18 @@ def simplify_region(data):
         'Espagne': 'Europe'
     }
 
-    data["Region"] = data["Pays"].map(region_mapping).fillna('Unknown')
+    data["Region"] = data["Pays"].map(region_mapping).astype(object).fillna('Unknown')
     return data
 
 
-def add_company_frequency(data):
-    company_frequency = data["Société"].value_counts()
-    data["Company_Frequency"] = data["Société"].map(company_frequency)
+def add_company_frequency(data, company_counts=None):
+    # Companies are counted within the data unless precomputed counts are given
+    company_frequency = data["Société"].value_counts() if company_counts is None else company_counts
+    frequencies = data["Société"].map(company_frequency)
+    if isinstance(frequencies.dtype, pd.CategoricalDtype):
+        # Mapping a categorical column can give a categorical of counts, the model needs numbers
+        frequencies = pd.Series(np.asarray(frequencies), index=frequencies.index)
+    data["Company_Frequency"] = frequencies
     return data
 
 
@@ -139,16 +161,14 @@ def simplify_company_name(name):
     if pd.isnull(name):
         return name
     name = name.lower()
-    name = re.sub(r'[^a-z0-9\s]', '', name)
-    common_words = ['group', 'inc', 'company', 'corporation', 'ltd', 'limited', 'sarl', 'spa', 'sa']
-    for word in common_words:
-        name = re.sub(rf'\b{word}\b', '', name)
-    name = re.sub(r'\s+', ' ', name).strip()
+    name = NON_ALPHANUMERIC_RE.sub('', name)
+    name = COMMON_COMPANY_WORDS_RE.sub('', name)
+    name = SPACES_RE.sub(' ', name).strip()
     return name
 
 
 def apply_simplify_company_name(data):
-    data['Société'] = data['Société'].apply(simplify_company_name)
+    data['Société'] = map_unique(data['Société'], lambda name: normalize_text_series(name, COMMON_COMPANY_WORDS_RE))
     return data
 
 
@@ -156,71 +176,47 @@ def simplify_job_title(job_title):
     if pd.isnull(job_title):
         return job_title
     job_title = job_title.lower()  # Convert to lowercase
-    job_title = re.sub(r'[^a-z0-9\s]', '', job_title)  # Remove non-alphanumeric characters
-    job_title = re.sub(r'\s+', ' ', job_title).strip()  # Remove extra spaces
+    job_title = NON_ALPHANUMERIC_RE.sub('', job_title)  # Remove non-alphanumeric characters
+    job_title = SPACES_RE.sub(' ', job_title).strip()  # Remove extra spaces
     return job_title
 
 
 def apply_simplify_job_title(data):
-    data['Fonction'] = data['Fonction'].apply(simplify_job_title)
+    data['Fonction'] = map_unique(data['Fonction'], normalize_text_series)
     return data
 
 
 def categorize_job_title(title):
-    title = str(title).lower()  # Normalize case
-    # IT/Tech roles
-    if any(keyword in title for keyword in ['it', 'tech', 'digital', 'cio', 'cto', 'information', 'systems']):
-        return 'IT/Tech'
-    # Finance roles
-    elif any(keyword in title for keyword in ['finance', 'account', 'cfo', 'credit', 'treasury', 'risk']):
-        return 'Finance'
-    # Marketing/Sales roles
-    elif any(keyword in title for keyword in ['marketing', 'sales', 'commercial', 'crm']):
-        return 'Marketing/Sales'
-    # Human Resources roles
-    elif any(keyword in title for keyword in ['hr', 'human', 'recruitment', 'talent', 'resources']):
-        return 'Human Resources'
-    # Operations/Administration roles
-    elif any(keyword in title for keyword in ['operations', 'logistics', 'admin', 'supply', 'process']):
-        return 'Operations/Administration'
-    # Leadership/Executive roles
-    elif any(keyword in title for keyword in ['director', 'chief', 'executive', 'ceo', 'head']):
-        return 'Leadership/Executive'
-    # Default category
-    return 'Other'
+    return load_keyword_matcher().classify(str(title).lower())["job_category"]
 
 
 def apply_categorize_job_title(data):
-    data['Job_Category'] = data['Fonction'].apply(categorize_job_title)
+    data['Job_Category'] = map_unique(
+        data['Fonction'], lambda title: load_keyword_matcher().classify_many(title.astype(str).str.lower(), ["job_category"])["job_category"]
+    )
     return data
 
 
 def is_large_company(name):
     if pd.isnull(name):
         return 0
-    name = name.lower()
-    large_companies = [
-        "orange", "renault", "total", "vodafone", "societe generale", "citibank", "bnp paribas",
-        "standard chartered", "toyota", "bgfi bank", "attijariwafa bank", "microsoft", "google",
-        "amazon", "airbus", "carrefour", "shell", "deutsche bank", "bp", "ecobank", "uba"
-    ]
-    large_patterns = ["group", "holding", "corporation", "international", "inc", "corporate"]
-    if any(large in name for large in large_companies):
-        return 1
-    elif any(pattern in name for pattern in large_patterns):
-        return 1
-    else:
-        return 0
+    return load_keyword_matcher().classify(name.lower())["large_company"]
 
 
 def apply_is_large_company(data):
-    data['is_large_company'] = data['Société'].apply(is_large_company)
+    # Missing names are not large companies: an empty text matches no keyword
+    data['is_large_company'] = map_unique(
+        data['Société'], lambda name: load_keyword_matcher().classify_many(name.str.lower().fillna(''), ["large_company"])["large_company"]
+    ).astype('int64')
     return data
 
 
-# Load original label encoders
-with open('label_encoders.pkl', 'rb') as f:
-    original_encoders = pickle.load(f)
+@lru_cache(maxsize=32)
+def encoding_table(encoder):
+    """
+    Lookup table from category to code, equivalent to encoder.transform, built once per encoder.
+    """
+    return {category: code for code, category in enumerate(encoder.classes_)}
 
 
 def map_with_original_encoding(data, column_name, encoder):
@@ -230,32 +226,33 @@ def map_with_original_encoding(data, column_name, encoder):
     # Get the current maximum value in the encoder
     max_value = len(encoder.classes_)
 
-    # Create a mapping function for the column
-    def map_value(x):
-        if x in encoder.classes_:
-            return encoder.transform([x])[0]  # Use the encoded value for known categories
-        else:
-            return max_value  # Assign a new value for unseen categories
-
-    # Apply the mapping function to the column
-    data[column_name] = data[column_name].apply(map_value)
+    # Known categories get their encoded value, unseen categories get max_value
+    values = data[column_name]
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        # Encode the categories only; missing values have code -1, which picks the appended max_value
+        codes = pd.Series(values.cat.categories).map(encoding_table(encoder)).fillna(max_value).to_numpy('int64')
+        data[column_name] = pd.Series(np.append(codes, max_value)[values.cat.codes.to_numpy()], index=values.index)
+    else:
+        data[column_name] = values.map(encoding_table(encoder)).fillna(max_value).astype('int64')
 
     return data
 
 
 
 
-def feature_engineering(data):
+@timed("feature_engineering")
+def feature_engineering(data, company_counts=None):
     data = apply_extract_seniority(data)
     data = simplify_sector(data)
     data = simplify_region(data)
-    data = add_company_frequency(data)
+    data = add_company_frequency(data, company_counts)
     data = apply_simplify_company_name(data)
     data = apply_simplify_job_title(data)
     data = apply_categorize_job_title(data)
     data = apply_is_large_company(data)
 
     # Map with original encoders
+    original_encoders = load_encoders()
     data = map_with_original_encoding(data, 'Seniority', original_encoders['Seniority'])
     data = map_with_original_encoding(data, 'Region', original_encoders['Region'])
     data = map_with_original_encoding(data, 'Job_Category', original_encoders['Job_Category'])
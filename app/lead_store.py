@@ -0,0 +1,97 @@
+"""
+Columnar storage of lead tables in Parquet: repeated text columns are stored as categoricals
+(dictionary encoded), files are read through memory maps, and qualified leads are appended
+as new files to a partitioned dataset instead of rewriting a CSV.
+"""
+import os
+import shutil
+import time
+import uuid
+from pathlib import Path
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from cache import CACHE_DIR
+
+# Columns with few distinct values repeated over many leads, Job and Company being
+# the names of Fonction and Société in the qualified leads
+CATEGORICAL_COLUMNS = ["Pays", "Secteur", "Société", "Fonction", "Job", "Company"]
+COLUMNAR_DIR = CACHE_DIR / "columnar"
+QUALIFIED_LEADS_DIR = CACHE_DIR / "qualified_leads"
+# Runs of qualified leads kept on disk; Streamlit adds one each time the script reruns with a file
+QUALIFIED_LEADS_KEEP_RUNS = int(os.getenv("QUALIFIED_LEADS_KEEP_RUNS", 20))
+
+
+def to_categorical(leads):
+    return leads.astype({column: "category" for column in CATEGORICAL_COLUMNS if column in leads.columns})
+
+
+def write_leads(leads, path):
+    """
+    Write leads to a Parquet file, with the categorical columns dictionary encoded.
+    """
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # Write then rename, so readers never see a partial file
+    partial_path = path.with_name(f".{path.name}.{uuid.uuid4().hex}")
+    pq.write_table(pa.Table.from_pandas(to_categorical(leads), preserve_index=False), partial_path)
+    os.replace(partial_path, path)
+
+
+def read_leads(path, columns=None):
+    """
+    Read leads from a Parquet file or dataset directory through a memory map.
+    Categorical columns are read back as pandas categoricals.
+    """
+    return pq.read_table(path, columns=columns, memory_map=True).to_pandas()
+
+
+def read_csv_columnar(csv_path, columnar_dir=COLUMNAR_DIR, **read_csv_kwargs):
+    """
+    Read a CSV through a Parquet copy, converted on the first read and again whenever the CSV changes.
+    """
+    csv_path = Path(csv_path)
+    parquet_path = Path(columnar_dir) / f"{csv_path.stem}.parquet"
+    if not parquet_path.exists() or parquet_path.stat().st_mtime < csv_path.stat().st_mtime:
+        write_leads(pd.read_csv(csv_path, **read_csv_kwargs), parquet_path)
+    return read_leads(parquet_path)
+
+
+class PartitionedLeadsWriter:
+    """
+    Append-only writer of qualified leads: each run gets its own run=<id> partition under root,
+    and each write adds a new Parquet file to it, so earlier results are never rewritten.
+    On close, only the keep_runs most recent runs are kept, 0 keeps every run.
+    Same interface as scoring.QualifiedLeadsWriter.
+    """
+
+    def __init__(self, root=QUALIFIED_LEADS_DIR, run_id=None, keep_runs=QUALIFIED_LEADS_KEEP_RUNS):
+        run_id = run_id or f"{time.strftime('%Y%m%dT%H%M%S')}-{uuid.uuid4().hex[:6]}"
+        self.root = Path(root)
+        self.path = self.root / f"run={run_id}"
+        self.keep_runs = keep_runs
+        self._parts = 0
+
+    def write(self, leads):
+        write_leads(leads, self.path / f"part-{self._parts:05d}.parquet")
+        self._parts += 1
+
+    def read(self, columns=None):
+        if not self._parts:
+            return pd.DataFrame()
+        return read_leads(self.path, columns)
+
+    def close(self):
+        if self.keep_runs and self.root.exists():
+            # Run ids start with their timestamp, so names sort from the oldest run to the newest
+            runs = sorted(path for path in self.root.glob("run=*") if path.is_dir() and path != self.path)
+            for path in runs[:max(0, len(runs) - self.keep_runs + 1)]:
+                shutil.rmtree(path, ignore_errors=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -1,46 +1,90 @@
-import pandas as pd
+import os
+
 import streamlit as st
-from chains import Chain
-from lead_qual import feature_engineering
-import joblib
+from chains import Chain, MAX_WORKERS, EMAIL_CACHE_ENABLED, group_jobs
+from artifacts import LOGO_PATH
+from metrics import RunStats, run_stats, timed, use_run_stats
+
+# pandas, the model and the scoring code are imported by the modes that need them only,
+# so that the app starts fast, e.g. for a manually entered lead
 
 
-def process_raw_data(raw_data):
+def process_raw_data(raw_data, prioritize=False, max_leads=None, threshold=None, workers=1):
+    import pandas as pd
+    from lead_store import PartitionedLeadsWriter
+    from scoring import TopLeads, score_leads_parallel
+
     try:
-        og_data = pd.read_csv('app/resource/Lead Qualification Data.csv')
-        og_data.drop(columns=['Output'], inplace=True)
-        raw_data.index = range(og_data.index.max() + 1, og_data.index.max() + 1 + len(raw_data))
-        og_data = pd.concat([og_data, raw_data])
-        og_data_eng = feature_engineering(og_data.copy())
         st.info("Prédiction des prospects qualifiés à l'aide du modèle AI...🧠 ")
-        model = joblib.load("lead_qual_model.pkl")
-        predictions = model.predict(og_data_eng)
-        og_data_eng['Predictions'] = predictions
-        raw_data_predictions = og_data_eng.loc[raw_data.index, 'Predictions']
+        scores = score_leads_parallel(raw_data, workers)
+        raw_data_predictions = scores["label"].rename('Predictions')
         st.write("Prediction value counts (raw_data only):")
         st.write(raw_data_predictions.value_counts())
-        qualified_leads = og_data.loc[raw_data_predictions.index][raw_data_predictions == 1]
+        if prioritize:
+            # Best leads first, within the score threshold and the email budget
+            ranking = TopLeads(max_leads, threshold)
+            ranking.add(raw_data, scores["probability"])
+            qualified_leads = ranking.result()
+        else:
+            qualified_leads = raw_data[raw_data_predictions == 1]
         st.write(f"Prospects qualifiés trouvés : {len(qualified_leads)}")
         if qualified_leads.empty:
             st.warning("Aucun prospect qualifié n'a été trouvé. 😔")
             return pd.DataFrame()
-        email_data = og_data.loc[qualified_leads.index, ['Contact', 'Fonction', 'Société']]
+        email_data = qualified_leads[['Contact', 'Fonction', 'Société', *(['Score'] if prioritize else [])]].copy()
         email_data.rename(columns={
             'Contact': 'Name',
             'Fonction': 'Job',
             'Société': 'Company'
         }, inplace=True)
-        # Save email data for debugging or further processing
-        email_data.to_csv('app/resource/email_data.csv', index=False)
+        # Keep the qualified leads of each run for debugging or further processing
+        with PartitionedLeadsWriter() as writer:
+            writer.write(email_data)
         return email_data
     except Exception as e:
         st.error(f"Une erreur est survenue :{e}")
         return pd.DataFrame()
 
 
+def process_raw_data_in_chunks(file_upload, chunksize=None, prioritize=False, max_leads=None, threshold=None, workers=1):
+    import pandas as pd
+    from lead_store import PartitionedLeadsWriter
+    from scoring import CHUNK_SIZE, prioritize_csv_in_chunks, score_csv_in_chunks
+
+    chunksize = chunksize or CHUNK_SIZE
+    try:
+        progress = st.progress(0.0)
+
+        def report(rows_done, total_rows, qualified):
+            progress.progress(
+                rows_done / max(total_rows, 1),
+                text=f"{rows_done}/{total_rows} prospects traités, {qualified} prospects qualifiés"
+            )
+
+        writer = PartitionedLeadsWriter()
+        if prioritize:
+            rows, qualified = prioritize_csv_in_chunks(file_upload, writer, max_leads, threshold, chunksize, report, workers)
+        else:
+            rows, qualified = score_csv_in_chunks(file_upload, writer, chunksize, report, workers)
+        st.write(f"Prospects qualifiés trouvés : {qualified} sur {rows}")
+        if not qualified:
+            st.warning("Aucun prospect qualifié n'a été trouvé. 😔")
+            return pd.DataFrame()
+        # The qualified leads are loaded back to be displayed and emailed
+        return writer.read()
+    except Exception as e:
+        st.error(f"Une erreur est survenue :{e}")
+        return pd.DataFrame()
+
+
+def show_portfolio_error(llm):
+    if llm.portfolio_error is not None:
+        st.warning(f"Les liens du portfolio sont indisponibles, les emails sont générés sans liens : {llm.portfolio_error}")
+
+
 def create_streamlit_app(llm):
     # Add a custom header image/logo
-    st.image("app/resource/Biware.png", use_column_width=True)
+    st.image(str(LOGO_PATH), use_column_width=True)
     st.title("📧 Biware Lead Qualification & Email Generator")
 
     # Step 1: Choose mode of operation
@@ -55,16 +99,59 @@ def create_streamlit_app(llm):
         ["Email de Prospection", "Email de Relance", "Remerciement", "Proposition", "Proposition de formation"]
     )
 
+    # Number of emails generated in parallel
+    max_workers = st.sidebar.number_input(
+        "Nombre d'emails générés en parallèle :", min_value=1, max_value=32, value=MAX_WORKERS
+    )
+    # Display emails token by token, one after the other, instead of generating them in parallel
+    stream = st.sidebar.checkbox("Afficher les emails au fur et à mesure de leur écriture")
+    # Bypass previously generated emails and ask the LLM again
+    llm.use_cache = not st.sidebar.checkbox("Régénérer sans utiliser le cache", value=not EMAIL_CACHE_ENABLED)
+    # Write one email per group of leads with the same job and company, personalized with each contact name
+    group = st.sidebar.checkbox(
+        "Regrouper les prospects similaires (même poste et même société)",
+        help="Un seul email est généré par groupe, puis personnalisé avec le nom de chaque contact. "
+             "Les emails ne sont alors plus affichés au fur et à mesure de leur écriture."
+    )
+
 
 
     if mode == "Qualification des prospects et génération d'emails":
+        import pandas as pd
+        from scoring import CHUNK_SIZE, SCORING_WORKERS
+
+        # Large files are scored chunk by chunk, which bounds the memory of feature engineering and
+        # scoring. The upload itself and the qualified leads shown afterwards stay in memory, only
+        # app/batch.py reading a file on disk keeps the whole run within a bounded memory
+        chunked = st.checkbox("Traiter le fichier par blocs (fichiers volumineux)")
+        if chunked:
+            chunksize = st.number_input("Nombre de prospects par bloc :", min_value=1000, value=CHUNK_SIZE, step=1000)
+            st.caption(
+                "Le fichier téléchargé et les prospects qualifiés restent en mémoire, et la taille des fichiers "
+                "téléchargés est limitée à 200 Mo. Pour des fichiers de plusieurs Go, utilisez plutôt "
+                "`python app/batch.py` sur le serveur."
+            )
+        # Spend the generation budget on the leads the model is most confident about
+        prioritize = st.checkbox("Prioriser les prospects par score (les meilleurs d'abord)")
+        if prioritize:
+            threshold = st.slider("Score minimum :", min_value=0.0, max_value=1.0, value=0.5, step=0.05)
+            max_leads = st.number_input("Nombre maximum d'emails (0 = sans limite) :", min_value=0, value=50, step=10)
+        else:
+            threshold, max_leads = None, None
+        # Large files are scored by several processes, each with its own copy of the model
+        scoring_workers = st.number_input(
+            "Nombre de processus de qualification :", min_value=1, max_value=os.cpu_count() or 1,
+            value=min(SCORING_WORKERS, os.cpu_count() or 1)
+        )
+
         # Upload raw CSV file
         file_upload = st.file_uploader("Téléchargez votre fichier CSV brut avec les données des clients :", type="csv")
 
         if file_upload:
             try:
-                # Loading the raw CSV data
-                raw_data = pd.read_csv(file_upload)
+                # Loading the raw CSV data, only a preview in chunked mode
+                with timed("read_csv"):
+                    raw_data = pd.read_csv(file_upload, nrows=5 if chunked else None)
 
                 # Displaying the uploaded raw data
                 st.info("Aperçu des données brutes téléchargées :")
@@ -78,7 +165,10 @@ def create_streamlit_app(llm):
 
                 # Process raw data through Lead Qualification
                 st.info("Traitement des données avec la qualification des prospects...⚙️")
-                email_data = process_raw_data(raw_data)
+                if chunked:
+                    email_data = process_raw_data_in_chunks(file_upload, chunksize, prioritize, max_leads, threshold, scoring_workers)
+                else:
+                    email_data = process_raw_data(raw_data, prioritize, max_leads, threshold, scoring_workers)
 
                 # Display qualified leads for email generation
                 if email_data.empty:
@@ -90,20 +180,23 @@ def create_streamlit_app(llm):
 
                 # Generate Emails
                 st.info("Génération des emails... ")
-                generate_emails(email_type,llm,mode,email_data)
+                generate_emails(email_type, llm, mode, email_data, max_workers=max_workers, stream=stream, group=group)
             except Exception as e:
                 st.error(f"An Error Occurred: {e}")
 
 
 
     elif mode == "Passer la qualification des prospects":
+        import pandas as pd
+
         # Upload raw CSV file
         file_upload = st.file_uploader("Upload your raw CSV file with client data:", type="csv")
 
         if file_upload:
             try:
                 # Loading the raw CSV data
-                raw_data = pd.read_csv(file_upload)
+                with timed("read_csv"):
+                    raw_data = pd.read_csv(file_upload)
 
                 # Ensure required columns are present
                 required_columns = ["Contact", "Fonction", "Société"]
@@ -118,7 +211,7 @@ def create_streamlit_app(llm):
                     'Fonction': 'Job',
                     'Société': 'Company'
                 })
-                generate_emails(email_type,llm,mode,email_data)
+                generate_emails(email_type, llm, mode, email_data, max_workers=max_workers, stream=stream, group=group)
             except Exception as e:
                 st.error(f"An Error Occurred: {e}")
 
@@ -133,61 +226,120 @@ def create_streamlit_app(llm):
 
         if st.button("Générer un email 📩 "):
             if name and job and company:
-                email_data = pd.DataFrame([{'Name': name, 'Job': job, 'Company': company}])
-                generate_emails(email_type,llm,mode,email_data)
+                email_data = [{'Name': name, 'Job': job, 'Company': company}]
+                generate_emails(email_type, llm, mode, email_data, stream=True)
             else:
                 st.error("Veuillez remplir tous les champs : Nom, Poste et Entreprise.")
 
 
 
     elif mode == "Scraper un site web pour générer des emails":
-        url = st.text_input("Entrez l'URL de la page de carrière ou d'emploi :")
+        urls = st.text_area("Entrez les URLs des pages de carrière ou d'emploi (une par ligne) :").split()
+        force_refresh = st.checkbox("Ignorer les pages et les jobs déjà enregistrés")
         if st.button("Scraper et générer des emails"):
             try:
                 st.info("Scraping en cours... 🌐")
-                scraped_text = llm.scrape_website(url)
-                jobs = llm.extract_jobs(scraped_text)
-
-                if not jobs:
-                    st.warning("Aucun job n'a été extrait de cette URL. Vérifiez le contenu.")
-                    return
-
-                for index, job in enumerate(jobs):
-                    # Display job details and generate email
-                    st.subheader(f"Détails du job :")
-                    st.write(f"**Rôle**: {job.get('role', 'Non fourni')}")
-                    st.write(f"**Entreprise**: {job.get('company', 'Non fourni')}")
-                    st.write(
-                        f"**Contact**: {job.get('contact_name', 'Responsable du recrutement')} ({job.get('contact_job_title', 'Non fourni')})")
-                    st.write(f"**Expérience requise**: {job.get('experience', 'Non fourni')}")
-                    st.write(
-                        f"**Compétences**: {', '.join(job.get('skills', [])) if job.get('skills') else 'Non fourni'}")
-                    st.write("**Description**:")
-                    st.write(job.get('description', 'Non fourni'))
-
-                    # Generate email automatically after displaying job details
-                    st. info(f"Génération de l'email pour le job {job.get('role', 'Non fourni')}... 📩")
-                    email= llm.write_mail_url(job, email_type)
-                    st.code(email, language="markdown")
+                # Pages are scraped and extracted in parallel, each one is displayed as soon as it is done
+                for url, jobs, error in llm.crawl(urls, max_workers=max_workers, force_refresh=force_refresh):
+                    st.header(url)
+                    if error is not None:
+                        st.error(f"Une erreur est survenue lors du scraping de cette URL : {error}")
+                        continue
+                    stats = llm.page_stats.get(url)
+                    if stats:
+                        reduction = 1 - stats["clean_tokens"] / max(stats["raw_tokens"], 1)
+                        st.caption(f"Tokens envoyés au LLM : {stats['clean_tokens']} au lieu de {stats['raw_tokens']} (-{reduction:.0%})")
+                    if not jobs:
+                        st.warning("Aucun job n'a été extrait de cette URL. Vérifiez le contenu.")
+                        continue
+
+                    links = llm.portfolio_links(jobs)
+                    show_portfolio_error(llm)
+                    for index, job in enumerate(jobs):
+                        # Display job details and generate email
+                        st.subheader(f"Détails du job :")
+                        st.write(f"**Rôle**: {job.get('role', 'Non fourni')}")
+                        st.write(f"**Entreprise**: {job.get('company', 'Non fourni')}")
+                        st.write(
+                            f"**Contact**: {job.get('contact_name', 'Responsable du recrutement')} ({job.get('contact_job_title', 'Non fourni')})")
+                        st.write(f"**Expérience requise**: {job.get('experience', 'Non fourni')}")
+                        st.write(
+                            f"**Compétences**: {', '.join(job.get('skills', [])) if job.get('skills') else 'Non fourni'}")
+                        st.write("**Description**:")
+                        st.write(job.get('description', 'Non fourni'))
+
+                        # Generate email automatically after displaying job details
+                        st. info(f"Génération de l'email pour le job {job.get('role', 'Non fourni')}... 📩")
+                        metrics = {}
+                        st.write_stream(llm.stream_mail_url(job, links[index], email_type=email_type, metrics=metrics))
+                        st.caption(latency_caption(metrics))
             except Exception as e:
                 st.error(f"Une erreur est survenue lors du scraping ou de la génération de l'email : {e}")
 
-def generate_emails(email_type, llm, mode, email_data=pd.DataFrame([]), job=[]):
+def latency_caption(metrics):
+    if metrics.get("cached"):
+        return "Email récupéré depuis le cache ⚡"
+    return (f"Premier token après {metrics.get('time_to_first_token', 0):.2f}s, "
+            f"email complet en {metrics.get('latency', 0):.2f}s")
+
+
+def stream_emails(email_type, llm, clients, jobs, links):
+    # Emails are generated one after the other, tokens are displayed as they arrive
+    all_emails = []
+    for client, job, job_links in zip(clients, jobs, links):
+        st.subheader(f"Generated {email_type} for {client['Name']}:")
+        metrics = {}
+        try:
+            email = st.write_stream(llm.stream_mail(job, job_links, metrics))
+        except Exception as e:
+            st.error(f"Une erreur est survenue lors de la génération de l'email : {e}")
+            continue
+        st.caption(latency_caption(metrics))
+        all_emails.append(email)
+    return all_emails
+
+
+def generate_emails(email_type, llm, mode, email_data=(), job=[], max_workers=MAX_WORKERS, stream=False, group=False):
     try:
-        all_emails = []
-        for _, client in email_data.iterrows():
-            job_description = {
-                "Contact": client["Name"],
-                "Job": client["Job"],
-                "Company": client["Company"],
-                "EmailType": email_type
-            }
-            email = llm.write_mail(job_description)
-            all_emails.append(email)
-
-            # Display each generated email
-            st.subheader(f"Generated {email_type} for {client['Name']}:")
-            st.code(email, language="markdown")
+        # Leads come as a DataFrame or as a list of dicts
+        clients = email_data.to_dict("records") if hasattr(email_data, "to_dict") else list(email_data)
+        jobs = [{
+            "Contact": client["Name"],
+            "Job": client["Job"],
+            "Company": client["Company"],
+            "EmailType": email_type
+        } for client in clients]
+        links = llm.portfolio_links(jobs)
+        show_portfolio_error(llm)
+
+        if stream and not group:
+            all_emails = stream_emails(email_type, llm, clients, jobs, links)
+        else:
+            write_mails = llm.write_mails
+            if group:
+                groups = len(group_jobs(jobs))
+                st.info(f"{groups} emails à générer pour {len(jobs)} prospects : {len(jobs) - groups} appels au LLM évités")
+                write_mails = llm.write_grouped_mails
+            # Reserve a slot per client so emails are displayed in input order as they land
+            placeholders = []
+            for client in clients:
+                st.subheader(f"Generated {email_type} for {client['Name']}:")
+                placeholders.append(st.empty())
+                placeholders[-1].info("Génération en cours... ⏳")
+
+            progress = st.progress(0.0)
+            all_emails = [None] * len(jobs)
+            done = 0
+            for index, email, error in write_mails(jobs, links, max_workers=max_workers):
+                done += 1
+                progress.progress(done / len(jobs), text=f"{done}/{len(jobs)} emails générés")
+                if error is not None:
+                    placeholders[index].error(f"Une erreur est survenue lors de la génération de l'email : {error}")
+                    continue
+                all_emails[index] = email
+                # Display each generated email
+                placeholders[index].code(email, language="markdown")
+            all_emails = [email for email in all_emails if email is not None]
 
         # Download of all emails as .txt
         if all_emails:
@@ -201,8 +353,34 @@ def generate_emails(email_type, llm, mode, email_data=pd.DataFrame([]), job=[]):
     except Exception as e:
         st.error(f"Une erreur est survenue lors de la génération de l'email : {e}")
 
+def show_run_stats():
+    """
+    Sidebar panel with the time spent per stage, the LLM tokens and the estimated cost of the last run
+    of the session.
+    """
+    summary = run_stats.summary()
+    with st.sidebar.expander("Statistiques d'exécution"):
+        if summary["stages"]:
+            # Markdown table rather than a DataFrame, which would import pandas in every mode
+            rows = [
+                f"| {stage} | {timing['calls']} | {timing['seconds']:.3f} | {timing['max_seconds']:.3f} |"
+                for stage, timing in summary["stages"].items()
+            ]
+            st.markdown("\n".join(["| Étape | Appels | Total (s) | Max (s) |", "|---|---|---|---|", *rows]))
+        st.write(f"Tokens : {summary['prompt_tokens']} en entrée, {summary['completion_tokens']} en sortie")
+        st.write(f"Coût estimé : {summary['estimated_cost_usd']:.4f} $")
+        if summary["counters"]:
+            st.write(summary["counters"])
+        st.download_button("Exporter (JSON)", run_stats.to_json(), file_name="run_stats.json", mime="application/json")
+        st.download_button("Exporter (Prometheus)", run_stats.to_prometheus(), file_name="run_stats.prom", mime="text/plain")
+
 
 if __name__ == "__main__":
-    chain = Chain()
-    st.set_page_config(layout="wide", page_title="Email Generator for Biware", page_icon="📧")
-    create_streamlit_app(chain)
+    # Each session has its own statistics, and each Streamlit rerun is one run of the pipeline
+    session_stats = st.session_state.setdefault("run_stats", RunStats())
+    session_stats.reset()
+    with use_run_stats(session_stats):
+        chain = Chain()
+        st.set_page_config(layout="wide", page_title="Email Generator for Biware", page_icon="📧")
+        create_streamlit_app(chain)
+        show_run_stats()
@@ -0,0 +1,183 @@
+import contextvars
+import functools
+import json
+import os
+import threading
+import time
+from contextlib import ContextDecorator, contextmanager
+
+# Groq price of llama-3.1-70b-versatile, in USD per 1000 tokens, used to estimate the cost of a run
+PROMPT_TOKEN_PRICE = float(os.getenv("LLM_PROMPT_TOKEN_PRICE", 0.00059))
+COMPLETION_TOKEN_PRICE = float(os.getenv("LLM_COMPLETION_TOKEN_PRICE", 0.00079))
+
+
+def token_usage(message):
+    """
+    Prompt and completion token counts of an LLM response, from its usage or Groq response metadata.
+    """
+    usage = getattr(message, "usage_metadata", None)
+    if usage:
+        return usage.get("input_tokens", 0), usage.get("output_tokens", 0)
+    usage = (getattr(message, "response_metadata", None) or {}).get("token_usage") or {}
+    return usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0)
+
+
+class RunStats:
+    """
+    Thread-safe collector of the time spent per pipeline stage, LLM token usage and counters of a run.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.started_at = time.time()
+            self.stages = {}
+            self.tokens = {}
+            self.counters = {}
+
+    def record(self, stage, seconds):
+        with self._lock:
+            timing = self.stages.setdefault(stage, {"calls": 0, "seconds": 0.0, "max_seconds": 0.0})
+            timing["calls"] += 1
+            timing["seconds"] += seconds
+            timing["max_seconds"] = max(timing["max_seconds"], seconds)
+
+    def merge_stages(self, stages):
+        """
+        Add stage timings recorded elsewhere, e.g. the summary()["stages"] of a worker process.
+        """
+        with self._lock:
+            for stage, other in stages.items():
+                timing = self.stages.setdefault(stage, {"calls": 0, "seconds": 0.0, "max_seconds": 0.0})
+                timing["calls"] += other["calls"]
+                timing["seconds"] += other["seconds"]
+                timing["max_seconds"] = max(timing["max_seconds"], other["max_seconds"])
+
+    def add_usage(self, stage, message):
+        prompt_tokens, completion_tokens = token_usage(message)
+        with self._lock:
+            tokens = self.tokens.setdefault(stage, {"prompt_tokens": 0, "completion_tokens": 0})
+            tokens["prompt_tokens"] += prompt_tokens
+            tokens["completion_tokens"] += completion_tokens
+
+    def increment(self, counter, value=1):
+        with self._lock:
+            self.counters[counter] = self.counters.get(counter, 0) + value
+
+    def summary(self):
+        with self._lock:
+            prompt_tokens = sum(tokens["prompt_tokens"] for tokens in self.tokens.values())
+            completion_tokens = sum(tokens["completion_tokens"] for tokens in self.tokens.values())
+            return {
+                "started_at": self.started_at,
+                "duration_seconds": time.time() - self.started_at,
+                "stages": {stage: dict(timing) for stage, timing in self.stages.items()},
+                "tokens": {stage: dict(tokens) for stage, tokens in self.tokens.items()},
+                "counters": dict(self.counters),
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "estimated_cost_usd": (prompt_tokens * PROMPT_TOKEN_PRICE + completion_tokens * COMPLETION_TOKEN_PRICE) / 1000,
+            }
+
+    def to_json(self):
+        return json.dumps(self.summary(), indent=2)
+
+    def to_prometheus(self, prefix="biware"):
+        summary = self.summary()
+        lines = [
+            f"# HELP {prefix}_stage_seconds_total Time spent per pipeline stage.",
+            f"# TYPE {prefix}_stage_seconds_total counter",
+        ]
+        lines += [f'{prefix}_stage_seconds_total{{stage="{stage}"}} {timing["seconds"]:.6f}' for stage, timing in summary["stages"].items()]
+        lines += [f"# HELP {prefix}_stage_calls_total Calls per pipeline stage.", f"# TYPE {prefix}_stage_calls_total counter"]
+        lines += [f'{prefix}_stage_calls_total{{stage="{stage}"}} {timing["calls"]}' for stage, timing in summary["stages"].items()]
+        lines += [f"# HELP {prefix}_stage_max_seconds Slowest call per pipeline stage.", f"# TYPE {prefix}_stage_max_seconds gauge"]
+        lines += [f'{prefix}_stage_max_seconds{{stage="{stage}"}} {timing["max_seconds"]:.6f}' for stage, timing in summary["stages"].items()]
+        lines += [f"# HELP {prefix}_llm_tokens_total LLM tokens per stage and type.", f"# TYPE {prefix}_llm_tokens_total counter"]
+        for stage, tokens in summary["tokens"].items():
+            lines.append(f'{prefix}_llm_tokens_total{{stage="{stage}",type="prompt"}} {tokens["prompt_tokens"]}')
+            lines.append(f'{prefix}_llm_tokens_total{{stage="{stage}",type="completion"}} {tokens["completion_tokens"]}')
+        lines += [f"# HELP {prefix}_events_total Pipeline event counters.", f"# TYPE {prefix}_events_total counter"]
+        lines += [f'{prefix}_events_total{{event="{counter}"}} {value}' for counter, value in summary["counters"].items()]
+        lines += [
+            f"# HELP {prefix}_llm_cost_usd_total Estimated LLM cost of the run.",
+            f"# TYPE {prefix}_llm_cost_usd_total counter",
+            f"{prefix}_llm_cost_usd_total {summary['estimated_cost_usd']:.6f}",
+        ]
+        return "\n".join(lines) + "\n"
+
+
+# Statistics of the runs not attached to a Streamlit session: batch job, scoring service, benchmark
+process_run_stats = RunStats()
+_current_run_stats = contextvars.ContextVar("run_stats", default=process_run_stats)
+
+
+@contextmanager
+def use_run_stats(stats):
+    """
+    Record the statistics of the block, and of the functions wrapped by with_run_stats in it, into stats,
+    e.g. the statistics of a Streamlit session, instead of the statistics of the process.
+    """
+    token = _current_run_stats.set(stats)
+    try:
+        yield stats
+    finally:
+        _current_run_stats.reset(token)
+
+
+def with_run_stats(func):
+    """
+    Wrap func to record into the statistics of the caller when it runs in a worker thread,
+    which does not inherit them.
+    """
+    stats = _current_run_stats.get()
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with use_run_stats(stats):
+            return func(*args, **kwargs)
+    return wrapper
+
+
+class _CurrentRunStats:
+    """
+    The RunStats of the current context: those given to use_run_stats, otherwise those of the process.
+    """
+
+    def __getattr__(self, name):
+        return getattr(_current_run_stats.get(), name)
+
+
+# Statistics of the current run
+run_stats = _CurrentRunStats()
+
+
+class timed(ContextDecorator):
+    """
+    Record the duration of a block or of each call of a function as the given stage:
+
+        with timed("predict"):
+            model.predict(features)
+
+        @timed("feature_engineering")
+        def feature_engineering(data): ...
+    """
+
+    def __init__(self, stage, stats=None):
+        self.stage = stage
+        self.stats = stats
+
+    def _recreate_cm(self):
+        # A fresh instance per decorated call, so concurrent calls do not share their start time
+        return timed(self.stage, self.stats)
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        (self.stats or run_stats).record(self.stage, time.perf_counter() - self._start)
+        return False
@@ -0,0 +1,116 @@
+import argparse
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+from artifacts import ROOT_DIR
+
+VECTORSTORE_PATH = ROOT_DIR / "vectorstore"
+PORTFOLIO_COLLECTION = "portfolio"
+# Number of portfolio links suggested per email, and number of query embeddings kept in memory
+PORTFOLIO_TOP_K = int(os.getenv("PORTFOLIO_TOP_K", 2))
+EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", 10000))
+# The ONNX embedding model (about 80 MB) is downloaded here on first use. Fetch it ahead, e.g. when
+# building a container image, with `python app/portfolio.py --prefetch`, so cold starts do not download it
+EMBEDDING_MODEL_DIR = Path(os.getenv("EMBEDDING_MODEL_DIR", ROOT_DIR / "models" / "all-MiniLM-L6-v2"))
+
+
+def default_embedding_function(model_dir=EMBEDDING_MODEL_DIR):
+    """
+    Chroma's default embedding model, all-MiniLM-L6-v2, stored in model_dir instead of the home directory.
+    """
+    from chromadb.utils.embedding_functions import ONNXMiniLM_L6_V2
+
+    embedding_function = ONNXMiniLM_L6_V2()
+    embedding_function.DOWNLOAD_PATH = Path(model_dir)
+    return embedding_function
+
+
+def prefetch_embedding_model(model_dir=EMBEDDING_MODEL_DIR):
+    """
+    Download the embedding model if needed, and check that it loads.
+    """
+    default_embedding_function(model_dir)(["Biware"])
+
+
+def job_query(job):
+    """
+    Text used to look up the portfolio for a job: its skills when known, otherwise its role and description.
+    """
+    skills = job.get("skills")
+    if skills:
+        return ", ".join(map(str, skills)) if isinstance(skills, list) else str(skills)
+    fields = ("role", "Job", "description")
+    return " ".join(str(job[field]) for field in fields if job.get(field)).strip()
+
+
+class Portfolio:
+    """
+    Retrieval of Biware portfolio links from the bundled Chroma vectorstore.
+    Query embeddings are cached, and all the queries of a batch are embedded and searched in one call.
+    """
+
+    def __init__(self, path=VECTORSTORE_PATH, collection_name=PORTFOLIO_COLLECTION, embedding_function=None):
+        import chromadb
+        from chromadb.config import Settings
+
+        self.client = chromadb.PersistentClient(path=str(path), settings=Settings(anonymized_telemetry=False))
+        self.collection = self.client.get_collection(collection_name)
+        self.embedding_function = embedding_function or default_embedding_function()
+        self._embeddings = OrderedDict()
+        self._lock = threading.Lock()
+
+    def embed(self, queries):
+        with self._lock:
+            missing = list(dict.fromkeys(query for query in queries if query not in self._embeddings))
+            if missing:
+                self._embeddings.update(zip(missing, self.embedding_function(missing)))
+            embeddings = []
+            for query in queries:
+                self._embeddings.move_to_end(query)
+                embeddings.append(self._embeddings[query])
+            while len(self._embeddings) > EMBEDDING_CACHE_SIZE:
+                self._embeddings.popitem(last=False)
+            return embeddings
+
+    def query_links(self, jobs, k=PORTFOLIO_TOP_K):
+        """
+        Return the links of the k most relevant portfolio entries for each job.
+        """
+        queries = [job_query(job) for job in jobs]
+        links = [[] for _ in jobs]
+        searchable = [index for index, query in enumerate(queries) if query]
+        if not searchable:
+            return links
+        embeddings = self.embed([queries[index] for index in searchable])
+        res = self.collection.query(query_embeddings=embeddings, n_results=k, include=["metadatas"])
+        for index, metadatas in zip(searchable, res["metadatas"]):
+            links[index] = [metadata["links"] for metadata in metadatas if metadata and metadata.get("links")]
+        return links
+
+
+_portfolio = None
+_portfolio_lock = threading.Lock()
+
+
+def get_portfolio():
+    """
+    Portfolio shared by the whole process, so the Chroma client is opened only once.
+    """
+    global _portfolio
+    with _portfolio_lock:
+        if _portfolio is None:
+            _portfolio = Portfolio()
+    return _portfolio
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Portfolio retrieval utilities.")
+    parser.add_argument("--prefetch", action="store_true", help=f"Download the embedding model to {EMBEDDING_MODEL_DIR}")
+    args = parser.parse_args()
+    if args.prefetch:
+        prefetch_embedding_model()
+        print(f"Embedding model ready in {EMBEDDING_MODEL_DIR}")
+    else:
+        parser.print_help()
@@ -0,0 +1,190 @@
+import os
+import random
+import threading
+import time
+
+from metrics import run_stats, token_usage
+from utils import estimate_tokens
+
+# Provider limits of the account, 0 (the default) disables a limit and only the 429 answers of the
+# provider slow calls down. The Groq free tier of llama-3.1-70b-versatile allows 30 requests and
+# 6000 tokens per minute
+LLM_REQUESTS_PER_MINUTE = int(os.getenv("LLM_REQUESTS_PER_MINUTE", 0))
+LLM_TOKENS_PER_MINUTE = int(os.getenv("LLM_TOKENS_PER_MINUTE", 0))
+# Calls sent to the provider at the same time
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", 8))
+# Retries of a call failing with a rate limit, server or connection error, and backoff bounds in seconds
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", 5))
+LLM_BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE", 1))
+LLM_BACKOFF_MAX = float(os.getenv("LLM_BACKOFF_MAX", 60))
+# Tokens reserved for the answer and the prompt template before the real usage is known
+LLM_COMPLETION_TOKENS = int(os.getenv("LLM_COMPLETION_TOKENS", 500))
+PROMPT_TEMPLATE_TOKENS = 200
+
+
+class TokenBucket:
+    """
+    Budget refilled continuously at rate_per_minute, holding at most one minute of budget.
+    Callers reserve their amount in arrival order and wait for it outside the lock, so the
+    bucket also acts as a FIFO queue. rate_per_minute=0 disables the limit.
+    """
+
+    def __init__(self, rate_per_minute):
+        self.rate = rate_per_minute / 60
+        self.capacity = rate_per_minute
+        self.available = rate_per_minute
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self.available = min(self.capacity, self.available + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, amount):
+        """
+        Take amount from the bucket and return the number of seconds to wait before using it.
+        """
+        if not self.rate:
+            return 0
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            # A single call larger than the bucket only waits for a full bucket
+            self.available -= min(amount, self.capacity)
+            return max(0, -self.available / self.rate)
+
+    def adjust(self, amount):
+        """
+        Give back (negative amount) or take more of the budget once the real usage is known.
+        """
+        if not self.rate:
+            return
+        with self._lock:
+            self._refill(time.monotonic())
+            self.available -= amount
+
+
+def is_transient(error):
+    """
+    Whether an LLM call failing with this error may succeed if retried later.
+    """
+    import groq
+
+    if isinstance(error, groq.APIConnectionError):
+        return True
+    status = getattr(error, "status_code", None) or getattr(getattr(error, "response", None), "status_code", None)
+    return status == 429 or (isinstance(status, int) and status >= 500)
+
+
+def retry_after(error):
+    """
+    Delay requested by the provider in the Retry-After header of the error, if any.
+    """
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+class LLMScheduler:
+    """
+    Gate for every call to the LLM, safe to share between threads.
+    Calls wait for their share of the requests and tokens per minute budgets, at most
+    max_concurrency of them run at once, and calls failing with a transient error are
+    retried with jittered exponential backoff. A rate limit answer pauses every call until
+    the delay requested by the provider has passed.
+    """
+
+    def __init__(self, requests_per_minute=LLM_REQUESTS_PER_MINUTE, tokens_per_minute=LLM_TOKENS_PER_MINUTE,
+                 max_concurrency=LLM_MAX_CONCURRENCY, max_retries=LLM_MAX_RETRIES,
+                 backoff_base=LLM_BACKOFF_BASE, backoff_max=LLM_BACKOFF_MAX):
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._slots = threading.BoundedSemaphore(max(1, max_concurrency))
+        self._paused_until = 0
+        self._lock = threading.Lock()
+
+    def estimate(self, inputs):
+        return PROMPT_TEMPLATE_TOKENS + estimate_tokens(" ".join(map(str, inputs.values()))) + LLM_COMPLETION_TOKENS
+
+    def _wait_for_budget(self, tokens):
+        wait = max(self.requests.reserve(1), self.tokens.reserve(tokens))
+        with self._lock:
+            wait = max(wait, self._paused_until - time.monotonic())
+        if wait > 0:
+            run_stats.record("llm_queue_wait", wait)
+            time.sleep(wait)
+
+    def _backoff(self, attempt, error):
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+        requested = retry_after(error)
+        if requested is not None:
+            delay = max(delay, requested)
+        if getattr(error, "status_code", None) == 429 or requested is not None:
+            with self._lock:
+                self._paused_until = max(self._paused_until, time.monotonic() + delay)
+        run_stats.increment("llm_retries")
+        time.sleep(delay)
+
+    def _settle(self, estimated, message):
+        # Correct the tokens budget with the real usage when the provider reports it
+        prompt_tokens, completion_tokens = token_usage(message)
+        if prompt_tokens or completion_tokens:
+            self.tokens.adjust(prompt_tokens + completion_tokens - estimated)
+
+    def invoke(self, runnable, inputs):
+        estimated = self.estimate(inputs)
+        for attempt in range(self.max_retries + 1):
+            self._wait_for_budget(estimated)
+            try:
+                with self._slots:
+                    message = runnable.invoke(inputs)
+            except Exception as e:
+                if attempt == self.max_retries or not is_transient(e):
+                    raise
+                self._backoff(attempt, e)
+                continue
+            self._settle(estimated, message)
+            return message
+
+    def stream(self, runnable, inputs):
+        """
+        Yield the chunks of the answer. A call is retried only if it fails before its first chunk.
+        """
+        estimated = self.estimate(inputs)
+        for attempt in range(self.max_retries + 1):
+            self._wait_for_budget(estimated)
+            message = None
+            try:
+                with self._slots:
+                    for chunk in runnable.stream(inputs):
+                        message = chunk if message is None else message + chunk
+                        yield chunk
+            except Exception as e:
+                if message is not None or attempt == self.max_retries or not is_transient(e):
+                    raise
+                self._backoff(attempt, e)
+                continue
+            if message is not None:
+                self._settle(estimated, message)
+            return
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler():
+    """
+    Scheduler shared by the whole process, so every session and every Chain draws on the same
+    provider budgets and waits out the same rate limit pauses.
+    """
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = LLMScheduler()
+    return _scheduler
@@ -0,0 +1,285 @@
+import heapq
+import multiprocessing
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import pandas as pd
+
+from artifacts import EMAIL_DATA_PATH, load_model
+from feature_store import load_feature_store
+from metrics import RunStats, run_stats, timed, use_run_stats
+
+# Number of rows read, engineered and scored at once in streaming mode
+CHUNK_SIZE = int(os.getenv("SCORING_CHUNK_SIZE", 50000))
+# Processes scoring leads in parallel, 1 scores in the calling process. Workers are spawned
+# rather than forked, forking the threads of the Streamlit server is not safe
+SCORING_WORKERS = int(os.getenv("SCORING_WORKERS", 1))
+SCORING_START_METHOD = os.getenv("SCORING_START_METHOD", "spawn")
+# Smaller frames are scored in the calling process, starting workers would take longer
+PARALLEL_MIN_ROWS = int(os.getenv("SCORING_PARALLEL_MIN_ROWS", 20000))
+
+EMAIL_COLUMNS = {
+    'Contact': 'Name',
+    'Fonction': 'Job',
+    'Société': 'Company'
+}
+
+
+def _rewind(source):
+    # Uploaded files are read several times, paths are simply reopened
+    if hasattr(source, "seek"):
+        source.seek(0)
+
+
+def read_csv_chunks(source, chunksize=CHUNK_SIZE, **kwargs):
+    _rewind(source)
+    return pd.read_csv(source, chunksize=chunksize, **kwargs)
+
+
+def score_leads(leads, company_counts=None, store=None, model=None):
+    """
+    Qualification probability and predicted label of each lead, indexed like the leads.
+    Company frequencies default to the historical counts plus the counts of the leads.
+    """
+    store = load_feature_store() if store is None else store
+    model = load_model() if model is None else model
+    features = store.engineer(leads, company_counts)
+    with timed("predict"):
+        probabilities = model.predict_proba(features)
+    # Same label as model.predict, without predicting twice
+    labels = model.classes_[probabilities.argmax(axis=1)]
+    return pd.DataFrame({"probability": probabilities[:, 1], "label": labels}, index=leads.index)
+
+
+# Model, feature store and company counts of a scoring worker process
+_worker = {}
+
+
+def _init_worker(company_counts):
+    _worker.update(store=load_feature_store(), model=load_model(), company_counts=company_counts)
+
+
+def _score_in_worker(leads):
+    # Stage timings of a worker are returned with its scores, to be merged into the caller's statistics
+    with use_run_stats(RunStats()) as stats:
+        scores = score_leads(leads, _worker["company_counts"], _worker["store"], _worker["model"])
+    return scores, stats.summary()["stages"]
+
+
+def _worker_result(result):
+    scores, stages = result
+    run_stats.merge_stages(stages)
+    return scores
+
+
+def scoring_pool(workers, company_counts):
+    """
+    Process pool where each worker loads the model and feature store once, and receives the
+    company counts once, when it starts, instead of with every partition.
+    """
+    return ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context(SCORING_START_METHOD),
+        initializer=_init_worker,
+        initargs=(company_counts,),
+    )
+
+
+def score_leads_parallel(leads, workers=SCORING_WORKERS, company_counts=None):
+    """
+    Same result as score_leads, computed by a pool of worker processes on contiguous partitions
+    of the leads. Company frequencies are counted once over all the leads, then shared.
+    """
+    store = load_feature_store()
+    if company_counts is None:
+        company_counts = store.company_frequencies(leads["Société"])
+    if workers <= 1 or len(leads) < PARALLEL_MIN_ROWS:
+        return score_leads(leads, company_counts, store)
+    # A few partitions per worker, so a slower partition does not hold the others back
+    partitions = workers * 4
+    bounds = [len(leads) * part // partitions for part in range(partitions + 1)]
+    parts = [leads.iloc[start:stop] for start, stop in zip(bounds, bounds[1:]) if stop > start]
+    with scoring_pool(workers, company_counts) as pool:
+        # map returns the results in partition order
+        return pd.concat([_worker_result(result) for result in pool.map(_score_in_worker, parts)])
+
+
+def count_companies(source, chunksize=CHUNK_SIZE):
+    """
+    First pass over a lead file: return the number of rows and the `Société` counts,
+    reading only that column chunk by chunk.
+    """
+    counts = pd.Series(dtype='int64')
+    rows = 0
+    for chunk in read_csv_chunks(source, chunksize, usecols=['Société'], dtype=str):
+        counts = counts.add(chunk['Société'].value_counts(), fill_value=0)
+        rows += len(chunk)
+    return rows, counts.astype('int64')
+
+
+class TopLeads:
+    """
+    Streaming selection of the best leads: those scoring at least threshold and, when max_leads
+    is set, only the max_leads best of them, kept in a min-heap so memory is bounded by max_leads.
+    Leads with the same score are kept in input order.
+    """
+
+    def __init__(self, max_leads=None, threshold=None):
+        self.max_leads = max_leads or None
+        self.threshold = threshold
+        self.columns = None
+        self._heap = []
+        self._seen = 0
+
+    def add(self, leads, probabilities):
+        candidates = leads.assign(Score=pd.Series(probabilities, index=leads.index))
+        candidates["_order"] = range(self._seen, self._seen + len(leads))
+        self._seen += len(leads)
+        if self.threshold is not None:
+            candidates = candidates[candidates["Score"] >= self.threshold]
+        if self.max_leads is not None:
+            # Only the best leads of the chunk can make it into the heap
+            candidates = candidates.nlargest(self.max_leads, "Score", keep="first")
+        self.columns = [column for column in candidates.columns if column != "_order"]
+        for row in candidates.itertuples(index=False, name=None):
+            item = (row[-2], -row[-1], row[:-1])
+            if self.max_leads is None or len(self._heap) < self.max_leads:
+                heapq.heappush(self._heap, item)
+            else:
+                heapq.heappushpop(self._heap, item)
+
+    def __len__(self):
+        return len(self._heap)
+
+    def result(self):
+        """
+        Selected leads with their Score column, highest score first.
+        """
+        rows = [row for _, _, row in sorted(self._heap, reverse=True)]
+        return pd.DataFrame(rows, columns=self.columns)
+
+
+def top_leads(leads, max_leads=None, threshold=None):
+    """
+    Score the leads and return the best ones, highest score first. See TopLeads.
+    """
+    ranking = TopLeads(max_leads, threshold)
+    ranking.add(leads, score_leads(leads)["probability"])
+    return ranking.result()
+
+
+class QualifiedLeadsWriter:
+    """
+    Write qualified leads incrementally to a CSV file, or to a Parquet file when the path ends with .parquet.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self._parquet_writer = None
+        self._started = False
+
+    def write(self, leads):
+        if self.path.suffix == ".parquet":
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+
+            schema = pa.schema([
+                (column, pa.string() if leads[column].dtype == object else pa.from_numpy_dtype(leads[column].dtype))
+                for column in leads.columns
+            ])
+            table = pa.Table.from_pandas(leads, schema=schema, preserve_index=False)
+            if self._parquet_writer is None:
+                self._parquet_writer = pq.ParquetWriter(self.path, schema)
+            self._parquet_writer.write_table(table)
+        else:
+            leads.to_csv(self.path, mode='a' if self._started else 'w', header=not self._started, index=False)
+        self._started = True
+
+    def close(self):
+        if not self._started:
+            # Leave a valid, empty file when nothing qualified
+            self.write(pd.DataFrame(columns=list(EMAIL_COLUMNS.values())))
+        if self._parquet_writer is not None:
+            self._parquet_writer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _writer(sink):
+    # Sinks are paths, or writers such as lead_store.PartitionedLeadsWriter
+    return sink if hasattr(sink, "write") else QualifiedLeadsWriter(sink)
+
+
+def score_chunks(source, chunksize=CHUNK_SIZE, workers=SCORING_WORKERS):
+    """
+    Score a lead CSV of any size chunk by chunk, yielding (chunk, scores, total_rows) in file order.
+    Company frequencies are counted over the reference leads and the whole file in a first pass.
+    With several workers, chunks are scored in parallel processes, at most two per worker in flight.
+    """
+    store = load_feature_store()
+    with timed("count_companies"):
+        total_rows, file_counts = count_companies(source, chunksize)
+    company_counts = store.company_counts.add(file_counts, fill_value=0).astype('int64')
+    chunks = read_csv_chunks(source, chunksize, dtype={column: str for column in store.columns})
+    if workers <= 1:
+        model = load_model()
+        for chunk in chunks:
+            yield chunk, score_leads(chunk, company_counts, store, model), total_rows
+        return
+
+    with scoring_pool(workers, company_counts) as pool:
+        pending = deque()
+        for chunk in chunks:
+            pending.append((chunk, pool.submit(_score_in_worker, chunk)))
+            if len(pending) >= 2 * workers:
+                chunk, future = pending.popleft()
+                yield chunk, _worker_result(future.result()), total_rows
+        while pending:
+            chunk, future = pending.popleft()
+            yield chunk, _worker_result(future.result()), total_rows
+
+
+def score_csv_in_chunks(source, sink=EMAIL_DATA_PATH, chunksize=CHUNK_SIZE, on_chunk=None, workers=SCORING_WORKERS):
+    """
+    Qualify a lead CSV of any size with bounded memory: each chunk is engineered, scored
+    and its qualified leads appended to the sink.
+    on_chunk(rows_done, total_rows, qualified) is called after each chunk.
+    Return the number of rows read and the number of qualified leads.
+    """
+    rows_done = 0
+    qualified = 0
+    with _writer(sink) as writer:
+        for chunk, scores, total_rows in score_chunks(source, chunksize, workers):
+            qualified_leads = chunk.loc[scores["label"] == 1, list(EMAIL_COLUMNS)].rename(columns=EMAIL_COLUMNS)
+            if not qualified_leads.empty:
+                writer.write(qualified_leads)
+            rows_done += len(chunk)
+            qualified += len(qualified_leads)
+            if on_chunk is not None:
+                on_chunk(rows_done, total_rows, qualified)
+    return rows_done, qualified
+
+
+def prioritize_csv_in_chunks(source, sink=EMAIL_DATA_PATH, max_leads=None, threshold=None, chunksize=CHUNK_SIZE, on_chunk=None,
+                             workers=SCORING_WORKERS):
+    """
+    Same as score_csv_in_chunks, but only the best leads are kept (see TopLeads) and written
+    to the sink once the whole file is scored, highest score first, with their Score column.
+    """
+    ranking = TopLeads(max_leads, threshold)
+    rows_done = 0
+    for chunk, scores, total_rows in score_chunks(source, chunksize, workers):
+        ranking.add(chunk[list(EMAIL_COLUMNS)].rename(columns=EMAIL_COLUMNS), scores["probability"])
+        rows_done += len(chunk)
+        if on_chunk is not None:
+            on_chunk(rows_done, total_rows, len(ranking))
+    with _writer(sink) as writer:
+        if len(ranking):
+            writer.write(ranking.result())
+    return rows_done, len(ranking)
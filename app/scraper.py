@@ -0,0 +1,125 @@
+import os
+import re
+import threading
+import time
+from urllib.parse import urlparse
+
+import requests
+from bs4 import BeautifulSoup
+from requests.adapters import HTTPAdapter
+
+from cache import make_key
+from metrics import run_stats
+from utils import clean_text, estimate_tokens
+
+# Timeout of a single request, minimum delay between two requests to the same host,
+# and number of pooled connections kept open per host
+SCRAPE_TIMEOUT = float(os.getenv("SCRAPE_TIMEOUT", 20))
+SCRAPE_HOST_INTERVAL = float(os.getenv("SCRAPE_HOST_INTERVAL", 1))
+SCRAPE_POOL_SIZE = int(os.getenv("SCRAPE_POOL_SIZE", 10))
+# Scraped pages and their extracted jobs are kept this long, for at most this many pages
+SCRAPE_CACHE_TTL = int(os.getenv("SCRAPE_CACHE_TTL", 7 * 24 * 3600))
+SCRAPE_CACHE_MAX_ENTRIES = int(os.getenv("SCRAPE_CACHE_MAX_ENTRIES", 2000))
+
+DEFAULT_HEADERS = {
+    "User-Agent": os.getenv(
+        "USER_AGENT",
+        "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0 Safari/537.36"
+    ),
+    "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
+    "Accept-Language": "fr-FR,fr;q=0.9,en;q=0.8",
+}
+
+# Page parts that never contain job postings: scripts, navigation, sidebars, forms, cookie banners...
+BOILERPLATE_TAGS = ["script", "style", "noscript", "template", "svg", "iframe", "nav", "aside", "footer", "form"]
+BOILERPLATE_ATTRIBUTE_RE = re.compile(r"cookie|consent|gdpr|rgpd|newsletter|breadcrumb|navbar|social|share", re.IGNORECASE)
+
+
+class PageFetcher:
+    """
+    Fetch web pages over a pooled HTTP session, safe to share between threads.
+    Requests to the same host are spaced by at least host_interval seconds.
+    With a cache, pages already seen are revalidated with conditional GETs and
+    reused from the cache when the server answers 304 Not Modified.
+    """
+
+    def __init__(self, timeout=SCRAPE_TIMEOUT, host_interval=SCRAPE_HOST_INTERVAL, pool_size=SCRAPE_POOL_SIZE, cache=None):
+        self.timeout = timeout
+        self.cache = cache
+        self.host_interval = host_interval
+        self.session = requests.Session()
+        self.session.headers.update(DEFAULT_HEADERS)
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._next_request = {}
+        self._lock = threading.Lock()
+
+    def _wait_for_host(self, host):
+        # Reserve the next free slot for this host, then sleep outside the lock
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_request.get(host, now))
+            self._next_request[host] = slot + self.host_interval
+        if slot > now:
+            time.sleep(slot - now)
+
+    def get(self, url, headers=None):
+        self._wait_for_host(urlparse(url).netloc)
+        response = self.session.get(url, headers=headers, timeout=self.timeout)
+        response.raise_for_status()
+        return response
+
+    def _download(self, url, force_refresh=False):
+        cached = None if self.cache is None or force_refresh else self.cache.get(url)
+        headers = {}
+        if cached is not None:
+            if cached["etag"]:
+                headers["If-None-Match"] = cached["etag"]
+            if cached["last_modified"]:
+                headers["If-Modified-Since"] = cached["last_modified"]
+        response = self.get(url, headers=headers)
+        if cached is not None and response.status_code == 304:
+            run_stats.increment("pages_not_modified")
+            return cached["body"]
+
+        response.encoding = response.apparent_encoding
+        body = response.text
+        if self.cache is not None:
+            self.cache.set(url, {
+                "body": body,
+                "etag": response.headers.get("ETag"),
+                "last_modified": response.headers.get("Last-Modified"),
+                "content_hash": make_key(body)
+            })
+        return body
+
+    def fetch_page(self, url, force_refresh=False):
+        """
+        Return the cleaned text of the page, its hash, and the estimated token counts before and after cleaning.
+        force_refresh ignores the cached copy and downloads the page again.
+        """
+        page = preprocess_html(self._download(url, force_refresh))
+        return {"url": url, "text_hash": make_key(page["text"]), **page}
+
+
+def preprocess_html(html):
+    """
+    Turn an HTML page into compact text for the LLM: boilerplate elements are dropped and the
+    text is cleaned line by line. raw_tokens is the size of the full page text, as sent before.
+    """
+    soup = BeautifulSoup(html, "html.parser")
+    raw_tokens = estimate_tokens(soup.get_text().strip())
+    for element in soup(BOILERPLATE_TAGS):
+        element.decompose()
+    # The page header is boilerplate, unlike the header of a job posting inside an article
+    for element in soup("header"):
+        if element.find_parent("article") is None:
+            element.decompose()
+    for attribute in ("id", "class"):
+        for element in soup.find_all(attrs={attribute: BOILERPLATE_ATTRIBUTE_RE}):
+            # Some sites flag the whole page, e.g. <body class="cookie-banner-open">
+            if element.name not in ("html", "body", "main", "article"):
+                element.decompose()
+    text = clean_text(soup.get_text("\n"))
+    return {"text": text, "raw_tokens": raw_tokens, "clean_tokens": estimate_tokens(text)}
@@ -0,0 +1,216 @@
+"""
+Local HTTP service scoring leads with the qualification model, for the CRM integration.
+
+    python app/service.py --port 8502
+
+POST /score with one lead, e.g. {"Contact": ..., "Fonction": ..., "Société": ..., "Secteur": ..., "Pays": ...},
+answers {"probability": 0.87, "label": 1}; a list of leads answers a list of results.
+Single leads received at the same time are scored together in one model call.
+Lead fields are strings, or null when unknown; other values answer 400, as does an empty list.
+GET /health checks the service is up, GET /metrics returns the run statistics in Prometheus format.
+"""
+import argparse
+import json
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pandas as pd
+
+from artifacts import load_model
+from feature_store import load_feature_store
+from metrics import run_stats
+from scoring import score_leads
+
+SCORING_HOST = os.getenv("SCORING_HOST", "127.0.0.1")
+SCORING_PORT = int(os.getenv("SCORING_PORT", 8502))
+# Leads scored in one model call at most, and time the first lead of a batch waits for others
+SCORING_MAX_BATCH_SIZE = int(os.getenv("SCORING_MAX_BATCH_SIZE", 256))
+SCORING_MAX_WAIT_MS = float(os.getenv("SCORING_MAX_WAIT_MS", 5))
+
+
+class Scorer:
+    """
+    Model and feature store kept in memory. Each lead is scored as if it were alone: its company
+    frequency counts the historical leads plus itself, whatever the other leads of the batch.
+    """
+
+    def __init__(self):
+        self.store = load_feature_store()
+        self.model = load_model()
+        # Warm up the model and the encoding tables before the first request
+        self.score([dict.fromkeys(self.store.columns, "")])
+
+    def score(self, leads):
+        leads = pd.DataFrame(leads, columns=self.store.columns)
+        company_counts = self.store.company_frequencies(leads["Société"].drop_duplicates())
+        scores = score_leads(leads, company_counts, self.store, self.model)
+        return [
+            {"probability": float(probability), "label": int(label)}
+            for probability, label in zip(scores["probability"], scores["label"])
+        ]
+
+
+class MicroBatcher:
+    """
+    Collect leads submitted from several threads and score them in batches of at most
+    max_batch_size, waiting at most max_wait_ms after the first lead of a batch.
+    """
+
+    def __init__(self, scorer, max_batch_size=SCORING_MAX_BATCH_SIZE, max_wait_ms=SCORING_MAX_WAIT_MS):
+        self.scorer = scorer
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self._queue = queue.Queue()
+        self._worker = threading.Thread(target=self._run, daemon=True)
+        self._worker.start()
+
+    def submit(self, lead):
+        future = Future()
+        self._queue.put((lead, future))
+        return future
+
+    def _next_batch(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=timeout))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            run_stats.increment("scoring_batches")
+            run_stats.increment("scored_leads", len(batch))
+            try:
+                results = self.scorer.score([lead for lead, _ in batch])
+            except Exception:
+                # Score the leads one by one, so that a bad lead fails its own request only
+                self._score_one_by_one(batch)
+                continue
+            for (_, future), result in zip(batch, results):
+                future.set_result(result)
+
+    def _score_one_by_one(self, batch):
+        for lead, future in batch:
+            try:
+                future.set_result(self.scorer.score([lead])[0])
+            except Exception as e:
+                future.set_exception(e)
+
+
+def validation_error(leads, columns):
+    """
+    Error message for leads that cannot be scored, None when they are valid.
+    """
+    if not leads:
+        return "No lead to score"
+    for lead in leads:
+        if not isinstance(lead, dict):
+            return "Each lead must be a JSON object"
+        missing = [column for column in columns if column not in lead]
+        if missing:
+            return f"Missing fields: {', '.join(missing)}"
+        invalid = [column for column in columns if lead[column] is not None and not isinstance(lead[column], str)]
+        if invalid:
+            return f"Fields must be strings or null: {', '.join(invalid)}"
+    return None
+
+
+class ScoringHandler(BaseHTTPRequestHandler):
+    batcher = None
+    columns = []
+
+    def _send_json(self, status, payload):
+        self._send(status, json.dumps(payload, ensure_ascii=False), "application/json")
+
+    def _send(self, status, body, content_type):
+        body = body.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", f"{content_type}; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == "/health":
+            self._send_json(200, {"status": "ok"})
+        elif self.path == "/metrics":
+            self._send(200, run_stats.to_prometheus(), "text/plain")
+        else:
+            self._send_json(404, {"error": "Not found"})
+
+    def do_POST(self):
+        if self.path != "/score":
+            self._send_json(404, {"error": "Not found"})
+            return
+        try:
+            payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+        except (ValueError, json.JSONDecodeError):
+            self._send_json(400, {"error": "Invalid JSON body"})
+            return
+        leads = payload if isinstance(payload, list) else [payload]
+        error = validation_error(leads, self.columns)
+        if error is not None:
+            self._send_json(400, {"error": error})
+            return
+        try:
+            if isinstance(payload, list):
+                # A list is already a batch, it is scored in one call
+                results = self.batcher.scorer.score(leads)
+            else:
+                results = self.batcher.submit(payload).result()
+        except Exception as e:
+            self._send_json(500, {"error": str(e)})
+            return
+        self._send_json(200, results)
+
+    def log_message(self, format, *args):
+        # One log line per request would slow down high request rates
+        pass
+
+
+class ScoringServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # The default backlog of 5 connections resets clients sending many requests at once
+    request_queue_size = 128
+
+
+def create_server(host=SCORING_HOST, port=SCORING_PORT, max_batch_size=SCORING_MAX_BATCH_SIZE, max_wait_ms=SCORING_MAX_WAIT_MS):
+    scorer = Scorer()
+    handler = type("Handler", (ScoringHandler,), {
+        "batcher": MicroBatcher(scorer, max_batch_size, max_wait_ms),
+        "columns": scorer.store.columns,
+    })
+    return ScoringServer((host, port), handler)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve lead qualification scores over HTTP.")
+    parser.add_argument("--host", default=SCORING_HOST)
+    parser.add_argument("--port", type=int, default=SCORING_PORT)
+    parser.add_argument("--max-batch-size", type=int, default=SCORING_MAX_BATCH_SIZE, help="Leads scored in one model call at most")
+    parser.add_argument("--max-wait-ms", type=float, default=SCORING_MAX_WAIT_MS, help="Time a lead waits for others to be batched with")
+    args = parser.parse_args(argv)
+
+    server = create_server(args.host, args.port, args.max_batch_size, args.max_wait_ms)
+    print(f"Scoring service listening on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
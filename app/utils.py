@@ -1,16 +1,107 @@
 import re
 
+HTML_TAG_RE = re.compile(r'<[^>]*?>')
+URL_RE = re.compile(r'http[s]?://(?:[a-zA-Z]|[0-9]|[$-_@.&+]|[!*\\(\\),]|(?:%[0-9a-fA-F][0-9a-fA-F]))+')
+# Letters of any language (accents included), digits and the punctuation useful to read a job posting
+SPECIAL_CHARS_RE = re.compile(r"[^\w\s.,;:!?'’()/&@+%€$-]")
+SPACES_RE = re.compile(r'[^\S\n]+')
+NEWLINES_RE = re.compile(r'\s*\n\s*')
+
+
 def clean_text(text):
     # Remove HTML tags
-    text = re.sub(r'<[^>]*?>', '', text)
+    text = HTML_TAG_RE.sub('', text)
     # Remove URLs
-    text = re.sub(r'http[s]?://(?:[a-zA-Z]|[0-9]|[$-_@.&+]|[!*\\(\\),]|(?:%[0-9a-fA-F][0-9a-fA-F]))+', '', text)
+    text = URL_RE.sub('', text)
     # Remove special characters
-    text = re.sub(r'[^a-zA-Z0-9 ]', '', text)
-    # Replace multiple spaces with a single space
-    text = re.sub(r'\s{2,}', ' ', text)
+    text = SPECIAL_CHARS_RE.sub('', text)
+    # Replace multiple spaces with a single space, keeping one line break between lines
+    text = SPACES_RE.sub(' ', text)
+    text = NEWLINES_RE.sub('\n', text)
     # Trim leading and trailing whitespace
-    text = text.strip()
-    # Remove extra whitespace
-    text = ' '.join(text.split())
-    return text
\ No newline at end of file
+    return text.strip()
+
+
+# Lines that usually start a new job posting. Markdown-like "#" headings are already
+# removed by clean_text, so job postings are recognized by their first words
+JOB_START_RE = re.compile(r'^\s*(?:poste|offre|job|position|r[ôo]le|emploi|stage|cdi|cdd|intitul[ée])\b', re.IGNORECASE)
+TERMINAL_PUNCTUATION = ('.', ',', ';', ':', '!', '?')
+
+
+def estimate_tokens(text):
+    # Rough estimate for Llama-style tokenizers, about 4 characters per token
+    return len(text) // 4 + 1
+
+
+def is_job_start(line):
+    return bool(JOB_START_RE.match(line))
+
+
+def is_section_break(line):
+    """
+    Weaker boundary inside a posting: a blank line or a short title-like line without end punctuation.
+    """
+    line = line.strip()
+    return not line or is_job_start(line) or (len(line) <= 80 and not line.endswith(TERMINAL_PUNCTUATION))
+
+
+def _split_long(text, max_tokens):
+    # Last resort for a single line over budget: cut on whitespace near the limit
+    max_chars = max(1, max_tokens - 1) * 4
+    parts = []
+    while len(text) > max_chars:
+        cut = text.rfind(' ', 0, max_chars)
+        cut = cut if cut > 0 else max_chars
+        parts.append(text[:cut])
+        text = text[cut:].lstrip()
+    parts.append(text)
+    return parts
+
+
+def _group_lines(lines, starts_section):
+    # Non-blank lines grouped into sections, a new section starting at each boundary line
+    sections = []
+    current = []
+    for line in lines:
+        if current and starts_section(line):
+            sections.append(current)
+            current = []
+        if line.strip():
+            current.append(line)
+    if current:
+        sections.append(current)
+    return sections
+
+
+def _section_pieces(lines, max_tokens):
+    # A section over budget is cut at its weaker boundaries first, then line by line
+    text = "\n".join(lines)
+    if estimate_tokens(text) <= max_tokens:
+        return [text]
+    parts = _group_lines(lines, is_section_break)
+    if len(parts) == 1:
+        return [piece for line in lines for piece in _split_long(line, max_tokens)]
+    return [piece for part in parts for piece in _section_pieces(part, max_tokens)]
+
+
+def split_text(text, max_tokens):
+    """
+    Split text into chunks of at most max_tokens estimated tokens.
+    Chunks end right before a line starting a job posting, so a posting is only cut when it does
+    not fit in a chunk on its own; it is then cut at blank or title-like lines, then between lines.
+    """
+    if estimate_tokens(text) <= max_tokens:
+        return [text]
+
+    chunks = []
+    current = ""
+    for section in _group_lines(text.splitlines(), is_job_start):
+        for piece in _section_pieces(section, max_tokens):
+            candidate = f"{current}\n{piece}" if current else piece
+            if current and estimate_tokens(candidate) > max_tokens:
+                chunks.append(current)
+                candidate = piece
+            current = candidate
+    if current:
+        chunks.append(current)
+    return chunks
@@ -0,0 +1,381 @@
+"""
+Benchmarks of the lead qualification and email generation paths.
+
+    python benchmarks/bench.py --sizes 1000 100000 --output benchmarks/results/current.json
+    python benchmarks/bench.py --baseline benchmarks/results/baseline.json --threshold 0.2
+
+Lead files of the requested sizes are synthesized from the trained_data.csv schema and kept
+in benchmarks/data/. Email generation runs against a local fake LLM with a fixed latency, so
+the gain of concurrent generation can be measured offline. With --fake-rpm the fake LLM also
+answers 429 errors over that many requests per minute, to exercise the LLM scheduler:
+
+    python benchmarks/bench.py --sizes --emails 40 --latency 0.1 --fake-rpm 60 --scheduler-rpm 60
+
+Results are written as JSON; with --baseline, the run fails when a timing or memory peak
+regresses by more than the threshold.
+"""
+import argparse
+import json
+import os
+import platform
+import re
+import subprocess
+import sys
+import threading
+import time
+import tracemalloc
+from types import SimpleNamespace
+from pathlib import Path
+
+BENCH_DIR = Path(__file__).resolve().parent
+ROOT_DIR = BENCH_DIR.parent
+DATA_DIR = BENCH_DIR / "data"
+sys.path.insert(0, str(ROOT_DIR / "app"))
+# Offline run: no portfolio lookup, and emails are never served from the cache
+os.environ.setdefault("PORTFOLIO_DISABLED", "1")
+os.environ.setdefault("GROQ_API_KEY", "benchmark")
+
+import numpy as np
+import pandas as pd
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+import lead_qual
+from artifacts import load_encoders, load_model
+from lead_store import read_leads, write_leads
+from metrics import run_stats
+from scheduler import LLMScheduler
+
+LEAD_COLUMNS = ["Pays", "Secteur", "Société", "Contact", "Fonction"]
+DEFAULT_SIZES = [1000, 100000, 1000000]
+# Share of synthesized leads working for a company absent from the training data
+NEW_COMPANY_RATE = 0.3
+# Timings shorter than this are too noisy to be compared between runs
+MIN_COMPARED_SECONDS = 0.01
+
+FEATURE_STEPS = [
+    ("apply_extract_seniority", lead_qual.apply_extract_seniority),
+    ("simplify_sector", lead_qual.simplify_sector),
+    ("simplify_region", lead_qual.simplify_region),
+    ("add_company_frequency", lead_qual.add_company_frequency),
+    ("apply_simplify_company_name", lead_qual.apply_simplify_company_name),
+    ("apply_simplify_job_title", lead_qual.apply_simplify_job_title),
+    ("apply_categorize_job_title", lead_qual.apply_categorize_job_title),
+    ("apply_is_large_company", lead_qual.apply_is_large_company),
+]
+ENCODED_COLUMNS = ["Seniority", "Region", "Job_Category", "Simplified_Sector", "Société", "Pays"]
+
+
+def synthesize_leads(rows, seed=0):
+    """
+    Leads drawn column by column from trained_data.csv, with part of the companies renamed
+    so that unseen categories are exercised too.
+    """
+    reference = pd.read_csv(ROOT_DIR / "trained_data.csv")[LEAD_COLUMNS]
+    rng = np.random.default_rng(seed)
+    leads = pd.DataFrame({
+        column: reference[column].to_numpy()[rng.integers(0, len(reference), rows)] for column in LEAD_COLUMNS
+    })
+    new_company = rng.random(rows) < NEW_COMPANY_RATE
+    suffixes = pd.Series(rng.integers(0, max(rows // 20, 1), rows)).astype(str)
+    leads.loc[new_company, "Société"] = leads.loc[new_company, "Société"] + " " + suffixes[new_company]
+    return leads
+
+
+def lead_file(rows, suffix=".csv"):
+    path = DATA_DIR / f"leads_{rows}{suffix}"
+    if not path.exists():
+        DATA_DIR.mkdir(parents=True, exist_ok=True)
+        leads = synthesize_leads(rows)
+        if suffix == ".parquet":
+            write_leads(leads, path)
+        else:
+            leads.to_csv(path, index=False)
+    return path
+
+
+def best_time(func, repeat):
+    """
+    Best wall time of func over repeat runs, and the result of the last run.
+    """
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def peak_memory_mb(func):
+    # Measured in a separate run, tracing allocations slows the code down
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1] / 2 ** 20
+    finally:
+        tracemalloc.stop()
+
+
+def engineer_by_step(leads):
+    """
+    Run the steps of lead_qual.feature_engineering one by one and return their timings.
+    """
+    timings = {}
+    data = leads.copy()
+    for name, step in FEATURE_STEPS:
+        start = time.perf_counter()
+        data = step(data)
+        timings[name] = time.perf_counter() - start
+    encoders = load_encoders()
+    start = time.perf_counter()
+    for column in ENCODED_COLUMNS:
+        data = lead_qual.map_with_original_encoding(data, column, encoders[column])
+    timings["map_with_original_encoding"] = time.perf_counter() - start
+    data.drop(columns=["Secteur", "Contact", "Fonction"], inplace=True)
+    return timings, data
+
+
+def bench_qualification(rows, repeat):
+    path = lead_file(rows)
+    read_seconds, leads = best_time(lambda: pd.read_csv(path), repeat)
+    parquet_path = lead_file(rows, ".parquet")
+    read_parquet_seconds, columnar_leads = best_time(lambda: read_leads(parquet_path), repeat)
+    # Artifacts are loaded before timing, as in a warm app
+    model = load_model()
+    load_encoders()
+
+    step_runs = [engineer_by_step(leads) for _ in range(repeat)]
+    steps = {name: min(timings[name] for timings, _ in step_runs) for name in step_runs[0][0]}
+    fe_seconds, features = best_time(lambda: lead_qual.feature_engineering(leads.copy()), repeat)
+    if not features.equals(step_runs[0][1]):
+        raise RuntimeError("The benchmark steps no longer match lead_qual.feature_engineering")
+    predict_seconds, predictions = best_time(lambda: model.predict(features), repeat)
+
+    return {
+        "rows": rows,
+        "qualified": int((predictions == 1).sum()),
+        "seconds": {
+            "read_csv": read_seconds,
+            "read_parquet": read_parquet_seconds,
+            **{f"feature_engineering.{name}": seconds for name, seconds in steps.items()},
+            "feature_engineering": fe_seconds,
+            "predict": predict_seconds,
+        },
+        "rows_per_second": {
+            "feature_engineering": rows / fe_seconds,
+            "map_with_original_encoding": rows / steps["map_with_original_encoding"],
+            "predict": rows / predict_seconds,
+        },
+        "frame_memory_mb": {
+            "csv": leads.memory_usage(deep=True).sum() / 2 ** 20,
+            "parquet": columnar_leads.memory_usage(deep=True).sum() / 2 ** 20,
+        },
+        "peak_memory_mb": {
+            "feature_engineering": peak_memory_mb(lambda: lead_qual.feature_engineering(leads.copy())),
+            "predict": peak_memory_mb(lambda: model.predict(features)),
+        },
+    }
+
+
+IMPORTTIME_RE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+# Modules whose import time is tracked: the app entry point and what each mode imports on first use
+STARTUP_MODULES = ["main", "chains", "scoring", "scraper"]
+
+
+def import_times(module=None):
+    """
+    Cumulative import time in seconds of a module in a fresh interpreter, and of the top-level
+    modules it imports, from the python -X importtime report. Without module, the imports of
+    the interpreter startup.
+    """
+    env = {**os.environ, "PYTHONPATH": str(ROOT_DIR / "app")}
+    report = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}" if module else "pass"],
+        env=env, capture_output=True, text=True, check=True,
+    ).stderr
+    times = {}
+    for match in IMPORTTIME_RE.finditer(report):
+        _, cumulative, indent, name = match.groups()
+        # Only the modules imported directly by the import statement, i.e. the least indented ones
+        if len(indent) <= 3:
+            times[name] = int(cumulative) / 1e6
+    return times
+
+
+def bench_startup(repeat):
+    results = {"seconds": {}, "slowest_imports": {}}
+    interpreter_imports = set(import_times())
+    for module in STARTUP_MODULES:
+        runs = [import_times(module) for _ in range(repeat)]
+        best = min(runs, key=lambda times: times[module])
+        results["seconds"][f"import.{module}"] = best[module]
+        slowest = sorted(((seconds, name) for name, seconds in best.items()
+                          if name != module and name not in interpreter_imports), reverse=True)[:5]
+        results["slowest_imports"][module] = {name: seconds for seconds, name in slowest}
+    return results
+
+
+class RateLimitError(Exception):
+    status_code = 429
+
+    def __init__(self, retry_after):
+        super().__init__("429 Too Many Requests")
+        self.response = SimpleNamespace(status_code=429, headers={"retry-after": f"{retry_after:.3f}"})
+
+
+# Requests budget of the fake provider, refilled continuously like the Groq limits
+_fake_budget = {}
+_fake_budget_lock = threading.Lock()
+
+
+class FakeLLM(BaseChatModel):
+    """
+    Chat model answering a fixed email after a fixed latency, with Groq-like token usage.
+    Over rpm_limit requests per minute, it fails like the provider with a 429 error.
+    """
+    latency: float = 0.5
+    rpm_limit: int = 0
+    model_name: str = "fake"
+
+    @property
+    def _llm_type(self):
+        return "fake"
+
+    def _check_rate_limit(self):
+        with _fake_budget_lock:
+            now = time.monotonic()
+            available, updated = _fake_budget.get("requests", (self.rpm_limit, now))
+            available = min(self.rpm_limit, available + (now - updated) * self.rpm_limit / 60)
+            if available < 1:
+                _fake_budget["requests"] = (available, now)
+                raise RateLimitError((1 - available) * 60 / self.rpm_limit)
+            _fake_budget["requests"] = (available - 1, now)
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        if self.rpm_limit:
+            self._check_rate_limit()
+        time.sleep(self.latency)
+        prompt_tokens = sum(len(str(message.content)) for message in messages) // 4
+        message = AIMessage(
+            content="Objet : Benchmark\n\nBonjour,\n\nCeci est un email de test.\n\nCordialement",
+            usage_metadata={"input_tokens": prompt_tokens, "output_tokens": 20, "total_tokens": prompt_tokens + 20},
+        )
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+
+def bench_generation(emails, latency, workers_list, fake_rpm=0, scheduler_rpm=0):
+    import streamlit.logger
+
+    import chains
+    import main
+
+    # generate_emails renders to Streamlit, run here without a UI
+    streamlit.logger.set_log_level("error")
+    leads = synthesize_leads(emails, seed=1).rename(columns={"Contact": "Name", "Fonction": "Job", "Société": "Company"})
+    results = {
+        "emails": emails, "latency": latency, "fake_rpm": fake_rpm, "scheduler_rpm": scheduler_rpm,
+        "seconds": {}, "emails_per_second": {}, "llm_retries": {},
+    }
+    for workers in workers_list:
+        # Only the requests per minute limit of the fake provider, if any, applies
+        scheduler = LLMScheduler(requests_per_minute=scheduler_rpm, tokens_per_minute=0)
+        chain = chains.Chain(use_cache=False, llm=FakeLLM(latency=latency, rpm_limit=fake_rpm), scheduler=scheduler)
+        _fake_budget.clear()
+        run_stats.reset()
+        start = time.perf_counter()
+        main.generate_emails("Email de Prospection", chain, "benchmark", leads, max_workers=workers)
+        seconds = time.perf_counter() - start
+        results["seconds"][f"generate_emails.workers_{workers}"] = seconds
+        results["emails_per_second"][f"workers_{workers}"] = emails / seconds
+        results["llm_retries"][f"workers_{workers}"] = run_stats.summary()["counters"].get("llm_retries", 0)
+    serial = results["seconds"].get("generate_emails.workers_1")
+    if serial:
+        results["speedup"] = {
+            f"workers_{workers}": serial / results["seconds"][f"generate_emails.workers_{workers}"]
+            for workers in workers_list
+        }
+    return results
+
+
+def compared_metrics(results):
+    """
+    Flatten the timings and memory peaks of a run, the metrics checked for regressions.
+    """
+    metrics = {}
+    for rows, qualification in results["qualification"].items():
+        for name, seconds in qualification["seconds"].items():
+            metrics[f"qualification.{rows}.seconds.{name}"] = seconds
+        for name, megabytes in qualification["peak_memory_mb"].items():
+            metrics[f"qualification.{rows}.peak_memory_mb.{name}"] = megabytes
+    for name, seconds in results.get("startup", {}).get("seconds", {}).items():
+        metrics[f"startup.seconds.{name}"] = seconds
+    if results.get("generation"):
+        for name, seconds in results["generation"]["seconds"].items():
+            metrics[f"generation.seconds.{name}"] = seconds
+    return metrics
+
+
+def find_regressions(results, baseline, threshold):
+    current = compared_metrics(results)
+    regressions = []
+    for name, previous in compared_metrics(baseline).items():
+        value = current.get(name)
+        if value is None or (".seconds." in name and previous < MIN_COMPARED_SECONDS):
+            continue
+        if value > previous * (1 + threshold):
+            regressions.append(f"{name}: {previous:.4f} -> {value:.4f} (+{(value / previous - 1) * 100:.0f}%)")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark lead qualification and email generation.")
+    parser.add_argument("--sizes", type=int, nargs="*", default=DEFAULT_SIZES, help="Numbers of synthesized leads to qualify")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per measure, the best time is kept")
+    parser.add_argument("--emails", type=int, default=20, help="Emails generated with the fake LLM, 0 to skip")
+    parser.add_argument("--latency", type=float, default=0.5, help="Seconds taken by the fake LLM per email")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 4, 8], help="Concurrent generation settings to compare")
+    parser.add_argument("--fake-rpm", type=int, default=0, help="Requests per minute over which the fake LLM answers 429 errors")
+    parser.add_argument("--scheduler-rpm", type=int, default=0, help="Requests per minute budget of the LLM scheduler, 0 for none")
+    parser.add_argument("--output", type=Path, help="JSON file the results are written to")
+    parser.add_argument("--baseline", type=Path, help="Previous results to compare with")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Allowed slowdown against the baseline, 0.2 for 20%%")
+    args = parser.parse_args(argv)
+
+    results = {
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "pandas": pd.__version__,
+        "qualification": {},
+    }
+    print("Startup benchmark...")
+    results["startup"] = bench_startup(args.repeat)
+    print(json.dumps(results["startup"], indent=2))
+    for rows in args.sizes:
+        print(f"Qualification benchmark, {rows} leads...")
+        results["qualification"][str(rows)] = bench_qualification(rows, args.repeat)
+        print(json.dumps(results["qualification"][str(rows)], indent=2))
+    if args.emails:
+        print(f"Generation benchmark, {args.emails} emails at {args.latency}s each...")
+        results["generation"] = bench_generation(args.emails, args.latency, args.workers, args.fake_rpm, args.scheduler_rpm)
+        print(json.dumps(results["generation"], indent=2))
+
+    if args.output:
+        args.output.parent.mkdir(parents=True, exist_ok=True)
+        args.output.write_text(json.dumps(results, indent=2), encoding="utf-8")
+        print(f"Results saved to {args.output}")
+
+    if args.baseline:
+        regressions = find_regressions(results, json.loads(args.baseline.read_text(encoding="utf-8")), args.threshold)
+        if regressions:
+            print(f"Regressions over {args.threshold:.0%} against {args.baseline}:")
+            print("\n".join(regressions))
+            return 1
+        print(f"No regression over {args.threshold:.0%} against {args.baseline}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# The app modules import each other as top-level modules, as when running app/main.py
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "app"))
@@ -0,0 +1,117 @@
+import json
+
+import pandas as pd
+import pytest
+
+import batch
+
+
+class FakeChain:
+    """
+    Chain writing "Email to <contact>" for each job, without portfolio or LLM.
+    """
+
+    def __init__(self):
+        self.contacts = []
+
+    def portfolio_links(self, jobs):
+        return [[] for _ in jobs]
+
+    def write_mails(self, jobs, links=None, max_workers=1, retries=0):
+        for index, job in enumerate(jobs):
+            self.contacts.append(job["Contact"])
+            yield index, f"Email to {job['Contact']}", None
+
+
+@pytest.fixture
+def fake_chain(monkeypatch):
+    chain = FakeChain()
+    monkeypatch.setattr(batch, "Chain", lambda: chain)
+    return chain
+
+
+def write_leads(path, names):
+    pd.DataFrame({"Name": names, "Job": "Data engineer", "Company": "Biware"}).to_csv(path, index=False)
+
+
+def read_results(path):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+
+def test_resume_refuses_another_input(tmp_path, fake_chain):
+    output = tmp_path / "results.jsonl"
+    first, second = tmp_path / "first.csv", tmp_path / "second.csv"
+    write_leads(first, ["Alice", "Bob"])
+    write_leads(second, ["Carol", "Dave"])
+
+    batch.main([str(first), "--output", str(output), "--skip-qualification"])
+    with pytest.raises(SystemExit):
+        batch.main([str(second), "--output", str(output), "--skip-qualification"])
+    assert [result["Name"] for result in read_results(output)] == ["Alice", "Bob"]
+
+    batch.main([str(second), "--output", str(output), "--skip-qualification", "--restart"])
+    assert [result["Name"] for result in read_results(output)] == ["Carol", "Dave"]
+
+
+def test_resume_refuses_other_options(tmp_path, fake_chain):
+    output = tmp_path / "results.jsonl"
+    leads = tmp_path / "leads.csv"
+    write_leads(leads, ["Alice", "Bob"])
+
+    batch.main([str(leads), "--output", str(output), "--skip-qualification"])
+    # Same input and options: nothing left to generate
+    batch.main([str(leads), "--output", str(output), "--skip-qualification"])
+    assert fake_chain.contacts == ["Alice", "Bob"]
+    with pytest.raises(SystemExit):
+        batch.main([str(leads), "--output", str(output), "--skip-qualification", "--email-type", "Email de Relance"])
+
+
+class CrashingChain(FakeChain):
+    """
+    FakeChain whose process dies after writing crash_after emails.
+    """
+
+    def __init__(self, crash_after):
+        super().__init__()
+        self.crash_after = crash_after
+
+    def write_mails(self, jobs, links=None, max_workers=1, retries=0):
+        for index, email, error in super().write_mails(jobs, links, max_workers, retries):
+            if index == self.crash_after:
+                raise KeyboardInterrupt
+            yield index, email, error
+
+
+def test_resume_after_crash(tmp_path):
+    output = tmp_path / "results.jsonl"
+    leads = pd.DataFrame({"Name": ["Alice", "Bob", "Carol", "Dave"], "Job": "Data engineer", "Company": "Biware"})
+
+    with pytest.raises(KeyboardInterrupt):
+        batch.generate(CrashingChain(crash_after=2), leads, "Email de Prospection", output)
+    # The process died while writing the third result
+    with open(output, "a", encoding="utf-8") as f:
+        f.write('{"row": 2, "Name": "Car')
+
+    chain = FakeChain()
+    batch.generate(chain, leads, "Email de Prospection", output)
+    assert chain.contacts == ["Carol", "Dave"]
+    assert [result["row"] for result in read_results(output)] == [0, 1, 2, 3]
+
+    csv_path = tmp_path / "results.csv"
+    batch.export_csv(output, csv_path)
+    exported = pd.read_csv(csv_path)
+    assert exported["Name"].tolist() == ["Alice", "Bob", "Carol", "Dave"]
+    assert exported["email"].tolist() == [f"Email to {name}" for name in exported["Name"]]
+
+
+def test_export_skips_truncated_line(tmp_path):
+    output = tmp_path / "results.jsonl"
+    leads = pd.DataFrame({"Name": ["Alice", "Bob"], "Job": "Data engineer", "Company": "Biware"})
+    batch.generate(FakeChain(), leads, "Email de Prospection", output)
+    with open(output, "a", encoding="utf-8") as f:
+        f.write('{"row": 2, "Na')
+
+    csv_path = tmp_path / "results.csv"
+    batch.export_csv(output, csv_path)
+    assert pd.read_csv(csv_path)["Name"].tolist() == ["Alice", "Bob"]
@@ -0,0 +1,28 @@
+from cache import DiskCache, get_cache
+
+
+def test_short_lived_instances_keep_the_cap(tmp_path):
+    # As in the UI, where every rerun builds a new Chain and its caches
+    for run in range(150):
+        cache = DiskCache("emails", max_entries=1000, cache_dir=tmp_path)
+        for index in range(9):
+            cache.set(f"{run}-{index}", index)
+    assert len(DiskCache("emails", max_entries=1000, cache_dir=tmp_path)) == 1000
+
+
+def test_shared_instance_keeps_the_cap(tmp_path):
+    for run in range(150):
+        cache = get_cache("emails", max_entries=1000, cache_dir=tmp_path)
+        for index in range(9):
+            cache.set(f"{run}-{index}", index)
+    assert get_cache("emails", cache_dir=tmp_path) is cache
+    # Eviction runs every 10 writes
+    assert len(cache) <= 1000 + 10
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    cache = get_cache("pages", max_entries=100, cache_dir=tmp_path)
+    for index in range(200):
+        cache.set(str(index), index)
+    assert cache.get("0") is None
+    assert cache.get("199") == 199
@@ -0,0 +1,47 @@
+"""
+Parity of the feature engineering with the original row-by-row implementation.
+
+data/baseline_features.csv holds the encoded features computed by the original lead_qual.py
+on data/leads.csv: the reference leads, followed by leads with missing values and with
+accented or non-latin titles and companies. Regenerate it only for an intended change of features.
+"""
+from pathlib import Path
+
+import pandas as pd
+import pytest
+
+from lead_qual import feature_engineering
+from lead_store import to_categorical
+
+DATA_DIR = Path(__file__).resolve().parent / "data"
+
+
+@pytest.fixture(scope="module")
+def leads():
+    return pd.read_csv(DATA_DIR / "leads.csv")
+
+
+@pytest.fixture(scope="module")
+def baseline_features():
+    return pd.read_csv(DATA_DIR / "baseline_features.csv")
+
+
+def assert_same_features(features, baseline_features):
+    # Values and column order must match, integer columns may come back as another integer type
+    pd.testing.assert_frame_equal(features.reset_index(drop=True), baseline_features, check_dtype=False)
+
+
+def test_features_match_baseline(leads, baseline_features):
+    assert_same_features(feature_engineering(leads.copy()), baseline_features)
+
+
+def test_categorical_leads_match_baseline(leads, baseline_features):
+    # Leads read back from Parquet have categorical text columns
+    assert_same_features(feature_engineering(to_categorical(leads)), baseline_features)
+
+
+def test_features_do_not_depend_on_batching(leads, baseline_features):
+    # Company frequencies are counted over all the leads, the other features row by row
+    company_counts = leads["Société"].value_counts()
+    parts = [feature_engineering(part.copy(), company_counts) for part in (leads.iloc[:500], leads.iloc[500:])]
+    assert_same_features(pd.concat(parts), baseline_features)
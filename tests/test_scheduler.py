@@ -0,0 +1,75 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+import pytest
+
+from metrics import RunStats, use_run_stats, with_run_stats
+from scheduler import LLMScheduler
+
+
+class RateLimitError(Exception):
+    """
+    429 answer of the provider, asking to retry after retry_after seconds.
+    """
+
+    status_code = 429
+
+    def __init__(self, retry_after):
+        super().__init__("Rate limit reached")
+        self.response = SimpleNamespace(status_code=429, headers={"retry-after": str(retry_after)})
+
+
+class FlakyLLM:
+    """
+    Runnable whose first calls fail, with a rate limit error by default. Records when each call started.
+    """
+
+    def __init__(self, failures, retry_after=0.2, error=RateLimitError):
+        self.failures = failures
+        self.retry_after = retry_after
+        self.error = error
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def invoke(self, inputs):
+        with self._lock:
+            self.calls.append(time.monotonic())
+            failing = len(self.calls) <= self.failures
+        if failing:
+            raise self.error(self.retry_after)
+        return f"Email to {inputs['contact']}"
+
+
+def scheduler(**kwargs):
+    return LLMScheduler(requests_per_minute=0, tokens_per_minute=0, backoff_base=0.001, **kwargs)
+
+
+def test_every_call_succeeds_after_rate_limits():
+    llm = FlakyLLM(failures=3, retry_after=0.05)
+    gate = scheduler(max_retries=5)
+    with use_run_stats(RunStats()) as stats:
+        invoke = with_run_stats(lambda contact: gate.invoke(llm, {"contact": contact}))
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            emails = list(executor.map(invoke, [f"contact {index}" for index in range(8)]))
+    assert emails == [f"Email to contact {index}" for index in range(8)]
+    assert stats.summary()["counters"]["llm_retries"] == 3
+
+
+def test_retry_after_is_honored():
+    llm = FlakyLLM(failures=1, retry_after=0.2)
+    gate = scheduler()
+    with use_run_stats(RunStats()):
+        assert gate.invoke(llm, {"contact": "Alice"}) == "Email to Alice"
+        failed_at, retried_at = llm.calls
+        assert retried_at - failed_at >= 0.2
+
+
+def test_other_errors_are_not_retried():
+    llm = FlakyLLM(failures=1, error=lambda retry_after: ValueError("Invalid prompt"))
+    with use_run_stats(RunStats()) as stats:
+        with pytest.raises(ValueError):
+            scheduler().invoke(llm, {"contact": "Alice"})
+    assert len(llm.calls) == 1
+    assert "llm_retries" not in stats.summary()["counters"]
@@ -0,0 +1,31 @@
+from pathlib import Path
+
+import pandas as pd
+
+import scoring
+from metrics import RunStats, use_run_stats
+
+DATA_DIR = Path(__file__).resolve().parent / "data"
+
+
+def test_parallel_scoring_keeps_worker_stage_timings(monkeypatch):
+    leads = pd.read_csv(DATA_DIR / "leads.csv")
+    monkeypatch.setattr(scoring, "PARALLEL_MIN_ROWS", 0)
+
+    expected = scoring.score_leads_parallel(leads, workers=1)
+    with use_run_stats(RunStats()) as stats:
+        scores = scoring.score_leads_parallel(leads, workers=2)
+
+    pd.testing.assert_frame_equal(scores, expected)
+    stages = stats.summary()["stages"]
+    # One call per partition, four partitions per worker
+    assert stages["predict"]["calls"] == 8
+    assert stages["feature_engineering"]["calls"] == 8
+
+
+def test_chunked_parallel_scoring_keeps_worker_stage_timings():
+    chunks = 0
+    with use_run_stats(RunStats()) as stats:
+        for _ in scoring.score_chunks(DATA_DIR / "leads.csv", chunksize=5, workers=2):
+            chunks += 1
+    assert stats.summary()["stages"]["predict"]["calls"] == chunks
@@ -0,0 +1,91 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from cache import DiskCache
+from metrics import RunStats, use_run_stats
+from scraper import PageFetcher
+
+LAST_MODIFIED = "Mon, 05 Oct 2026 08:00:00 GMT"
+
+
+class CareersPage(BaseHTTPRequestHandler):
+    """
+    Careers page with an ETag and a Last-Modified date, answering 304 to conditional GETs
+    for its current version.
+    """
+
+    version = "v1"
+    requests = []
+
+    def do_GET(self):
+        etag = f'"{self.version}"'
+        self.requests.append(dict(self.headers))
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+        body = f"<html><body><h1>Data engineer</h1><p>Offre {self.version}</p></body></html>".encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("ETag", etag)
+        self.send_header("Last-Modified", LAST_MODIFIED)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def page_url():
+    CareersPage.version = "v1"
+    CareersPage.requests = []
+    server = ThreadingHTTPServer(("127.0.0.1", 0), CareersPage)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_port}/careers"
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def fetcher(tmp_path):
+    fetcher = PageFetcher(host_interval=0, cache=DiskCache("pages", cache_dir=tmp_path))
+    # Reach the local server directly, whatever the proxy settings of the environment
+    fetcher.session.trust_env = False
+    return fetcher
+
+
+def test_unchanged_page_is_reused_from_the_cache(page_url, fetcher):
+    with use_run_stats(RunStats()) as stats:
+        first = fetcher.fetch_page(page_url)
+        second = fetcher.fetch_page(page_url)
+
+    assert "Offre v1" in first["text"]
+    assert second["text"] == first["text"]
+    assert second["text_hash"] == first["text_hash"]
+    assert CareersPage.requests[1]["If-None-Match"] == '"v1"'
+    assert CareersPage.requests[1]["If-Modified-Since"] == LAST_MODIFIED
+    assert stats.summary()["counters"]["pages_not_modified"] == 1
+
+
+def test_changed_page_is_downloaded_again(page_url, fetcher):
+    fetcher.fetch_page(page_url)
+    CareersPage.version = "v2"
+    with use_run_stats(RunStats()) as stats:
+        page = fetcher.fetch_page(page_url)
+
+    assert "Offre v2" in page["text"]
+    assert "pages_not_modified" not in stats.summary()["counters"]
+    # The new version is cached and revalidated next time
+    fetcher.fetch_page(page_url)
+    assert CareersPage.requests[-1]["If-None-Match"] == '"v2"'
+
+
+def test_force_refresh_skips_revalidation(page_url, fetcher):
+    fetcher.fetch_page(page_url)
+    fetcher.fetch_page(page_url, force_refresh=True)
+    assert "If-None-Match" not in CareersPage.requests[1]